@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import argparse as ap
+from datetime import datetime
+
+# Benchmark the working tree rather than an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from logbook.tools import memory
+
+import synthetic
+
+RESULT_FIELDS = ['method', 'files', 'rows', 'seconds', 'rows_per_sec']
+
+def parse_args():
+    argparser = ap.ArgumentParser('Time the accumulation of parsed hourly files')
+    argparser.add_argument('--files', type=int, default=365 * 24,
+        help='Number of hourly files (default: a year)')
+    argparser.add_argument('--rows', type=int, default=100,
+        help='Parsed rows per file')
+    argparser.add_argument('--stream', default='gyro',
+        choices=sorted(synthetic.SENSOR_STREAMS), help='Stream of the rows')
+    argparser.add_argument('--seed', type=int, default=1,
+        help='Random seed')
+    return argparser.parse_args()
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    columns = synthetic.SENSOR_STREAMS[args.stream][0]
+    # The same chunk is added for every file, only the accumulation is timed
+    chunk = synthetic.sensor_rows(args.stream, columns, rng, datetime(2019, 3, 8),
+        args.rows)
+
+    results = []
+    frames = {}
+    for method, f in [('DataFrame.append', with_append),
+            ('memory.Accumulator', with_accumulator)]:
+        start = time.time()
+        frames[method] = f(chunk, args.files)
+        seconds = time.time() - start
+        results.append({
+            'method': method,
+            'files': args.files,
+            'rows': len(frames[method]),
+            'seconds': round(seconds, 3),
+            'rows_per_sec': int(len(frames[method]) / seconds) if seconds else 0,
+        })
+
+    if not frames['DataFrame.append'].equals(frames['memory.Accumulator']):
+        raise ValueError('Accumulated rows differ')
+    print(pd.DataFrame(results, columns=RESULT_FIELDS).to_string(index=False))
+
+# How the data types used to collect their rows
+def with_append(chunk, files):
+    df = pd.DataFrame.from_records([])
+    for i in range(files):
+        df = df.append(chunk, ignore_index=True, sort=False)
+    return df
+
+def with_accumulator(chunk, files):
+    rows = memory.Accumulator()
+    for i in range(files):
+        rows.append(chunk)
+    return rows.frame()
+
+if __name__ == '__main__':
+    main()
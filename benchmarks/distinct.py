@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import argparse as ap
+
+# Benchmark the working tree rather than an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from logbook.tools import aggregate
+
+RESULT_FIELDS = ['method', 'days', 'rows', 'partial_rows', 'partial_mb',
+    'seconds', 'mean_error', 'max_error']
+
+def parse_args():
+    argparser = ap.ArgumentParser('Compare exact and sketched daily counts of distinct MACs')
+    argparser.add_argument('--days', type=int, default=7,
+        help='Number of days')
+    argparser.add_argument('--rows', type=int, default=10 ** 5,
+        help='Scanned rows per day')
+    argparser.add_argument('--macs', type=int, default=20000,
+        help='Distinct MACs that may be seen on a day')
+    argparser.add_argument('--batches', type=int, default=24,
+        help='Batches of rows per day, merged as the files of a stream are')
+    argparser.add_argument('--precision', type=int, nargs='+', default=[10, 12, 14],
+        help='Sketch precisions')
+    argparser.add_argument('--seed', type=int, default=1,
+        help='Random seed')
+    return argparser.parse_args()
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    df = mac_rows(rng, args.days, args.rows, args.macs)
+    batches = np.array_split(df, args.days * args.batches)
+
+    results = []
+    exact = None
+    for precision in [None] + args.precision:
+        aggregate.set_precision(precision)
+        start = time.time()
+        partial = aggregate.merge([aggregate.unique(b, ['day'], 'hashed MAC')
+            for b in batches])
+        counts = aggregate.count_unique(partial)
+        seconds = time.time() - start
+
+        if exact is None:
+            exact = counts
+        error = ((counts - exact).abs() / exact.astype(float))
+        results.append({
+            'method': 'exact' if precision is None else 'sketch p={P}'.format(P=precision),
+            'days': args.days,
+            'rows': len(df),
+            'partial_rows': len(partial),
+            'partial_mb': round(partial.memory_usage(index=True, deep=True).sum() / 2.0 ** 20, 2),
+            'seconds': round(seconds, 3),
+            'mean_error': round(error.mean(), 4),
+            'max_error': round(error.max(), 4),
+        })
+    aggregate.set_precision(None)
+
+    print(pd.DataFrame(results, columns=RESULT_FIELDS).to_string(index=False))
+
+# Scanned MACs of each day, drawn from a pool that grows with the day
+def mac_rows(rng, days, rows, macs):
+    frames = []
+    for day in range(1, days + 1):
+        pool = macs * day // days
+        frames.append(pd.DataFrame({
+            'day': day,
+            'hashed MAC': np.char.add('mac', rng.randint(0, pool, rows).astype(str)),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import argparse as ap
+import logging
+import multiprocessing as mp
+
+# Benchmark the working tree rather than an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import logbook
+from logbook.__version__ import __version__
+
+import synthetic
+
+logger = logging.getLogger(__name__)
+
+DATA_TYPES = ['phone', 'actigraphy', 'mri', 'mri_behav', 'mri_eye', 'physio',
+    'onsite_interview', 'surveys']
+
+# Streams that logbook.phone does not process
+SKIPPED_STREAMS = ['identifiers', 'reachability']
+
+RESULT_FIELDS = ['benchmark', 'jobs', 'failed', 'seconds', 'rows', 'rows_per_sec',
+    'mb', 'mb_per_sec', 'files', 'peak_mb', 'job_mb']
+
+def parse_args():
+    argparser = ap.ArgumentParser('Time logbook on a PHOENIX tree')
+    argparser.add_argument('--phoenix-dir',
+        help='Existing PHOENIX tree (default: generate a synthetic one)')
+    argparser.add_argument('--study', default=synthetic.STUDY,
+        help='Study to benchmark')
+    argparser.add_argument('--data-type', nargs='+', default=DATA_TYPES,
+        help='Data types to benchmark')
+    argparser.add_argument('--subjects', type=int, default=2,
+        help='Number of synthetic subjects')
+    argparser.add_argument('--days', type=int, default=3,
+        help='Number of synthetic days per subject')
+    argparser.add_argument('--rate', type=float, default=1.0,
+        help='Multiplier of the synthetic sampling rates')
+    argparser.add_argument('--gzip', type=float, default=0.25,
+        help='Fraction of the synthetic Beiwe files written as .csv.gz')
+    argparser.add_argument('--seed', type=int, default=1,
+        help='Random seed of the synthetic tree')
+    argparser.add_argument('--memory-budget', type=int,
+        help='Memory budget in MB of each job')
+    argparser.add_argument('--keep', action='store_true',
+        help='Keep the synthetic tree and the outputs')
+    argparser.add_argument('--output',
+        help='Write the results to a .json or .csv file')
+    argparser.add_argument('--debug', action='store_true',
+        help='Show the logbook logs')
+    return argparser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING,
+        format='%(asctime)s - %(process)d - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    work_dir = tempfile.mkdtemp(prefix='logbook-bench-')
+    try:
+        phoenix_dir = args.phoenix_dir
+        if phoenix_dir is None:
+            phoenix_dir = os.path.join(work_dir, 'PHOENIX')
+            start = time.time()
+            synthetic.generate(phoenix_dir, args.study, args.subjects, args.days,
+                args.rate, args.gzip, seed=args.seed)
+            logger.info('Generated {P} in {T:.1f}s'.format(P=phoenix_dir,
+                T=time.time() - start))
+
+        jobs = get_jobs(phoenix_dir, args.study, args.data_type,
+            os.path.join(work_dir, 'output'), args.memory_budget)
+        results = summarize([run_benchmark(label, job) for label, job in jobs])
+        print_results(results)
+
+        if args.output:
+            write_results(args.output, results, args)
+    finally:
+        if args.keep:
+            logger.info('Kept {D}'.format(D=work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+# Yield a labelled job for every subject and data type, and for every phone stream
+def get_jobs(phoenix_dir, study, data_types, output_dir, memory_budget=None):
+    consents = get_consents(os.path.join(phoenix_dir, 'GENERAL', study,
+        study + '_metadata.csv'))
+    for subject, date_from in sorted(consents.items()):
+        subject_dir = os.path.join(phoenix_dir, 'PROTECTED', study, subject)
+        for data_type in data_types:
+            read_dir = os.path.join(subject_dir, data_type, 'raw')
+            if not os.path.isdir(read_dir):
+                continue
+            job_output_dir = os.path.join(output_dir, subject, data_type)
+            if not os.path.isdir(job_output_dir):
+                os.makedirs(job_output_dir)
+            if data_type != 'phone':
+                yield data_type, logbook.Job(study, subject, data_type,
+                    read_dir=read_dir, output_dir=job_output_dir,
+                    date_from=date_from, memory_budget=memory_budget)
+                continue
+            for stream in get_streams(read_dir):
+                yield 'phone/' + stream, logbook.Job(study, subject, data_type,
+                    read_dir=read_dir, output_dir=job_output_dir,
+                    date_from=date_from, phone_streams=[stream],
+                    memory_budget=memory_budget)
+
+# Consent date of each subject
+def get_consents(path):
+    with open(path, 'r') as f:
+        return dict((row['Subject ID'], row['Consent']) for row in csv.DictReader(f))
+
+# Phone streams found under any Beiwe ID
+def get_streams(read_dir):
+    streams = set()
+    for beiwe_id in os.listdir(read_dir):
+        beiwe_dir = os.path.join(read_dir, beiwe_id)
+        if os.path.isdir(beiwe_dir):
+            streams.update(os.listdir(beiwe_dir))
+    return sorted(s for s in streams if s not in SKIPPED_STREAMS)
+
+# Run a job in a fresh child process to measure its memory in isolation
+def run_benchmark(label, job):
+    queue = mp.Queue()
+    child = mp.Process(target=run_child, args=(job, queue))
+    child.start()
+    result = queue.get()
+    child.join()
+    result['benchmark'] = label
+    logger.info('{B} {J}: {S} in {T}s'.format(B=label, J=job.subject,
+        S=result['status'], T=result['elapsed']))
+    return result
+
+def run_child(job, queue):
+    try:
+        start_rss = max_rss()
+        result = logbook.run_job(job)
+        result['start_rss'] = start_rss
+        result['peak_rss'] = max_rss()
+    except Exception as e:
+        logger.exception(e)
+        result = {'job': job.name, 'status': 'failed', 'error': str(e),
+            'elapsed': 0.0, 'stages': [], 'start_rss': 0, 'peak_rss': 0}
+    queue.put(result)
+
+# Peak resident set size of this process in bytes
+def max_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+# Add up the jobs of each benchmark
+def summarize(job_results):
+    results = []
+    labels = []
+    for result in job_results:
+        if result['benchmark'] not in labels:
+            labels.append(result['benchmark'])
+
+    for label in labels:
+        runs = [r for r in job_results if r['benchmark'] == label]
+        stages = [s for r in runs for s in r['stages']]
+        seconds = sum(r['elapsed'] for r in runs)
+        rows = sum(s['rows'] for s in stages if s['stage'] == 'read_csv')
+        mb = sum(s['bytes'] for s in stages) / 2.0 ** 20
+        results.append({
+            'benchmark': label,
+            'jobs': len(runs),
+            'failed': len([r for r in runs if r['status'] == 'failed']),
+            'seconds': round(seconds, 3),
+            'rows': rows,
+            'rows_per_sec': int(rows / seconds) if seconds else 0,
+            'mb': round(mb, 3),
+            'mb_per_sec': round(mb / seconds, 3) if seconds else 0,
+            'files': sum(s['files'] for s in stages),
+            'peak_mb': round(max(r['peak_rss'] for r in runs) / 2.0 ** 20, 1),
+            'job_mb': round(max(r['peak_rss'] - r['start_rss'] for r in runs) / 2.0 ** 20, 1),
+        })
+    return results
+
+def print_results(results):
+    df = pd.DataFrame(results, columns=RESULT_FIELDS)
+    total = df[['jobs', 'failed', 'seconds', 'rows', 'mb', 'files']].sum()
+    print(df.to_string(index=False))
+    print('')
+    print('Total: {J} jobs ({F} failed), {R} rows and {M:.1f} MB in {T:.1f}s'.format(
+        J=int(total['jobs']), F=int(total['failed']), R=int(total['rows']), M=total['mb'],
+        T=total['seconds']))
+
+# Write the results with the versions and parameters they were measured with
+def write_results(path, results, args):
+    try:
+        with open(path, 'w') as f:
+            if path.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+                writer.writeheader()
+                writer.writerows(results)
+            else:
+                json.dump({
+                    'logbook': __version__,
+                    'python': platform.python_version(),
+                    'pandas': pd.__version__,
+                    'parameters': vars(args),
+                    'results': results
+                }, f, indent=1, sort_keys=True)
+        logger.info('Wrote {P}'.format(P=path))
+    except Exception as e:
+        logger.error(e)
+        logger.error('Could not write results to {P}'.format(P=path))
+
+if __name__ == '__main__':
+    main()
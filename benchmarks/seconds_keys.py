@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import argparse as ap
+from datetime import datetime, timedelta
+
+# Benchmark the working tree rather than an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from logbook import phone
+from logbook import tools
+from logbook.tools import beiwe
+
+import synthetic
+
+STREAMS = ['accelerometer', 'wifi', 'calls', 'texts', 'power_state', 'proximity',
+    'ios_log', 'survey_timings']
+
+RESULT_FIELDS = ['stream', 'rows', 'seconds', 'string_sec', 'code_sec', 'speedup']
+
+def parse_args():
+    argparser = ap.ArgumentParser('Time the per-second grouping of phone streams '
+        'on NCF strings and on integer codes')
+    argparser.add_argument('--stream', nargs='+', default=STREAMS,
+        help='Streams to benchmark')
+    argparser.add_argument('--hours', type=int, default=24,
+        help='Hours of synthetic rows per stream')
+    argparser.add_argument('--rate', type=float, default=1.0,
+        help='Multiplier of the synthetic sampling rates')
+    argparser.add_argument('--output-tz', default='America/New_York',
+        help='Output time zone')
+    argparser.add_argument('--seed', type=int, default=1,
+        help='Random seed')
+    return argparser.parse_args()
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    start = datetime(2019, 3, 8)
+    date_from = pd.Timestamp(start, tz=args.output_tz)
+
+    results = []
+    for stream in args.stream:
+        mod = phone.import_mod(stream)
+        columns, per_second = synthetic.SENSOR_STREAMS[stream]
+        n = max(1, int(per_second * args.rate * 3600))
+        df = pd.concat([beiwe.parse(mod, synthetic.sensor_rows(stream, columns, rng,
+            start + timedelta(hours=hour), n), args.output_tz, 'UTC', stream)
+            for hour in range(args.hours)], ignore_index=True)
+        results.append(run_benchmark(stream, mod, df, date_from))
+
+    print(pd.DataFrame(results, columns=RESULT_FIELDS).to_string(index=False))
+
+# Time the partial and per-second aggregation of the same rows dated with
+# NCF strings (tools.parse_date_to) and with integer codes, and check the
+# seconds they give agree once the codes are formatted
+def run_benchmark(stream, mod, df, date_from):
+    strings = tools.parse_date_to(tools.bin_df_seconds(df.copy()), date_from)
+    codes = tools.parse_date_codes(tools.bin_df_seconds(df.copy()), date_from)
+
+    string_sec, expected = timed(lambda: process_seconds(mod, strings))
+    code_sec, seconds_data = timed(lambda: process_seconds(mod, codes))
+    seconds_data = phone.format_seconds(mod, seconds_data)
+
+    if not expected.to_csv(index=False) == seconds_data.to_csv(index=False):
+        raise ValueError('Seconds of {S} differ'.format(S=stream))
+
+    return {
+        'stream': stream,
+        'rows': len(df),
+        'seconds': len(seconds_data),
+        'string_sec': round(string_sec, 4),
+        'code_sec': round(code_sec, 4),
+        'speedup': round(string_sec / code_sec, 1) if code_sec else 0,
+    }
+
+def process_seconds(mod, df):
+    df = df.copy()
+    if hasattr(mod, 'partial_seconds'):
+        df = phone.merge_parts([mod.partial_seconds(df)])
+        if not isinstance(df, dict):
+            df = df.reset_index()
+    return tools.sort_seconds(mod.process_seconds(df).reset_index())
+
+def timed(f):
+    start = time.time()
+    result = f()
+    return time.time() - start, result
+
+if __name__ == '__main__':
+    main()
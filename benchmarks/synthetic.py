@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+import os
+import sys
+import gzip
+import json
+import argparse as ap
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+STUDY = 'BENCH'
+BEIWE_ID = 'beiwe1'
+
+# Beiwe streams written as hourly CSVs: columns after timestamp and
+# UTC time, and samples per second at rate 1.0
+SENSOR_STREAMS = {
+    'accelerometer': (['accuracy', 'x', 'y', 'z'], 2.0),
+    'gyro': (['x', 'y', 'z'], 1.0),
+    'magnetometer': (['x', 'y', 'z'], 1.0),
+    'wifi': (['hashed MAC', 'frequency', 'RSSI'], 0.05),
+    'bluetooth': (['hashed MAC', 'RSSI'], 0.05),
+    'calls': (['hashed phone number', 'call type', 'duration in seconds'], 0.002),
+    'texts': (['hashed phone number', 'sent vs received', 'message length',
+        'time sent'], 0.003),
+    'power_state': (['event'], 0.01),
+    'proximity': (['event'], 0.01),
+    'reachability': (['event'], 0.01),
+    'ios_log': (['launchId', 'memory', 'battery', 'event', 'msg', 'd1'], 0.01),
+    'app_log': (['launchId', 'memory', 'battery', 'event', 'msg', 'd1'], 0.01),
+    'survey_timings': (['question id', 'survey id', 'question type',
+        'question text', 'question answer options', 'answer', 'event'], 0.002),
+}
+
+# Beiwe streams counted by file name: file extension, and files per day
+FILE_STREAMS = {
+    'survey_answers': ('.csv', 2),
+    'audio_recordings': ('.wav', 2),
+    'gps': ('.csv', 5),
+    'devicemotion': ('.csv', 5),
+}
+
+EVENTS = {
+    'calls': ['Incoming Call', 'Outgoing Call', 'Missed Call'],
+    'texts': ['sent SMS', 'received SMS', 'sent MMS', 'received MMS'],
+    'power_state': ['Screen turned on', 'Screen turned off',
+        'Power connected', 'Power disconnected',
+        'Device Idle (Doze) state change signal received; device in idle state.',
+        'Device Idle (Doze) state change signal received; device not in idle state.',
+        'Device shut down signal received'],
+    'proximity': ['NearUser', 'NotNearUser'],
+    'reachability': ['cellular', 'wifi', 'unreachable'],
+    'ios_log': ['appStart', 'foreground', 'background'],
+    'app_log': ['evt'],
+    'survey_timings': ['notified', 'submitted', 'present'],
+}
+
+IDENTIFIER_COLUMNS = ['patient_id', 'MAC', 'phone_number', 'device_id',
+    'device_os', 'os_version', 'product', 'brand', 'hardware_id',
+    'manufacturer', 'model', 'beiwe_version']
+
+# Series written for each MRI session: description, repetition time (ms)
+# and number of instances
+MRI_SERIES = [
+    ('T1w_MPR_vNav_RMS', 2500.0, 1),
+    ('SMS_mb8_BOLD_REST1', 800.0, 20),
+    ('SMS_mb8_BOLD_REST1_SBRef', 800.0, 1),
+    ('SMS_mb8_BOLD_TASK1', 800.0, 20),
+    ('ASL_3D_tra', 4000.0, 5),
+]
+
+def parse_args(argv=None):
+    argparser = ap.ArgumentParser('Generate a synthetic PHOENIX tree')
+    argparser.add_argument('phoenix_dir',
+        help='Directory to create the PHOENIX tree in')
+    argparser.add_argument('--study', default=STUDY,
+        help='Study name')
+    argparser.add_argument('--subjects', type=int, default=2,
+        help='Number of subjects')
+    argparser.add_argument('--days', type=int, default=3,
+        help='Number of days of data per subject')
+    argparser.add_argument('--rate', type=float, default=1.0,
+        help='Multiplier of the sampling rate of every stream')
+    argparser.add_argument('--gzip', type=float, default=0.25,
+        help='Fraction of the Beiwe hourly files written as .csv.gz')
+    argparser.add_argument('--start', default='2019-03-08',
+        help='First day of data, also used as the consent date')
+    argparser.add_argument('--seed', type=int, default=1,
+        help='Random seed')
+    return argparser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    generate(args.phoenix_dir, args.study, args.subjects, args.days,
+        args.rate, args.gzip, args.start, args.seed)
+
+# Write a PHOENIX tree with a consent file and raw data for every data type
+def generate(phoenix_dir, study=STUDY, subjects=2, days=3, rate=1.0,
+        gzip_fraction=0.25, start='2019-03-08', seed=1):
+    rng = np.random.RandomState(seed)
+    start = datetime.strptime(start, '%Y-%m-%d')
+    subject_ids = ['{S}{N:03d}'.format(S=study[:2].upper(), N=n + 1)
+        for n in range(subjects)]
+
+    write_consents(phoenix_dir, study, subject_ids, start)
+    for subject in subject_ids:
+        logger.info('Generating {D} days of data for {S}'.format(D=days, S=subject))
+        subject_dir = os.path.join(phoenix_dir, 'PROTECTED', study, subject)
+        write_phone(os.path.join(subject_dir, 'phone', 'raw'), rng, start,
+            days, rate, gzip_fraction)
+        write_actigraphy(os.path.join(subject_dir, 'actigraphy', 'raw'), rng,
+            subject, start, days, rate)
+        write_mri(os.path.join(subject_dir, 'mri', 'raw'), rng, subject, start)
+        write_sessions(subject_dir, subject, start, days)
+        write_surveys(os.path.join(subject_dir, 'surveys', 'raw'), subject,
+            start, days)
+        make_dir(os.path.join(phoenix_dir, 'GENERAL', study, subject))
+
+    return subject_ids
+
+def write_consents(phoenix_dir, study, subject_ids, start):
+    study_dir = make_dir(os.path.join(phoenix_dir, 'GENERAL', study))
+    with open(os.path.join(study_dir, study + '_metadata.csv'), 'w') as f:
+        f.write('Subject ID,Consent\n')
+        for subject in subject_ids:
+            f.write('{S},{D}\n'.format(S=subject, D=start.strftime('%Y-%m-%d')))
+
+# Hourly files for every stream, leaving out some hours like a real phone
+def write_phone(raw_dir, rng, start, days, rate, gzip_fraction):
+    beiwe_dir = os.path.join(raw_dir, BEIWE_ID)
+    for stream, (columns, hz) in sorted(SENSOR_STREAMS.items()):
+        stream_dir = make_dir(os.path.join(beiwe_dir, stream))
+        for hour in range(days * 24):
+            if rng.rand() < 0.2:
+                continue
+            n = rng.poisson(hz * rate * 3600)
+            if n == 0:
+                continue
+            hour_start = start + timedelta(hours=hour)
+            df = sensor_rows(stream, columns, rng, hour_start, n)
+            extension = '.csv.gz' if rng.rand() < gzip_fraction else '.csv'
+            write_csv(df, os.path.join(stream_dir, file_name(hour_start, extension)))
+
+    for stream, (extension, per_day) in sorted(FILE_STREAMS.items()):
+        stream_dir = make_dir(os.path.join(beiwe_dir, stream))
+        if stream == 'survey_answers':
+            stream_dir = make_dir(os.path.join(stream_dir, 'survey1'))
+        for n in range(int(days * per_day * rate)):
+            seconds = rng.randint(0, days * 86400)
+            path = os.path.join(stream_dir,
+                file_name(start + timedelta(seconds=seconds), extension))
+            with open(path, 'w') as f:
+                f.write('a,b\n1,2\n')
+
+    identifiers_dir = make_dir(os.path.join(beiwe_dir, 'identifiers'))
+    df = pd.DataFrame([['x'] * len(IDENTIFIER_COLUMNS)], columns=IDENTIFIER_COLUMNS)
+    df.insert(0, 'UTC time', utc_times(np.array([epoch_ms(start)])))
+    df.insert(0, 'timestamp', epoch_ms(start))
+    write_csv(df, os.path.join(identifiers_dir, file_name(start, '.csv')))
+
+# Random rows of a stream within an hour
+def sensor_rows(stream, columns, rng, hour_start, n):
+    timestamps = np.sort(rng.randint(0, 3600000, n)) + epoch_ms(hour_start)
+    df = pd.DataFrame({'timestamp': timestamps,
+        'UTC time': utc_times(timestamps)})
+    for column in columns:
+        df[column] = column_values(stream, column, rng, n, timestamps)
+    return df[['timestamp', 'UTC time'] + columns]
+
+def column_values(stream, column, rng, n, timestamps):
+    if column in ['x', 'y', 'z', 'battery']:
+        return rng.rand(n).round(6)
+    elif column == 'accuracy':
+        return 'unknown'
+    elif column in ['hashed MAC', 'hashed phone number']:
+        return np.char.add('id', rng.randint(1, 40, n).astype(str))
+    elif column == 'frequency':
+        return rng.choice([2412, 5180], n)
+    elif column == 'RSSI':
+        return -rng.randint(30, 90, n)
+    elif column == 'duration in seconds':
+        return rng.randint(0, 600, n)
+    elif column == 'message length':
+        return rng.randint(1, 200, n)
+    elif column == 'time sent':
+        return timestamps
+    elif column == 'memory':
+        return rng.randint(100, 200, n)
+    elif column in ['event', 'call type', 'sent vs received']:
+        return rng.choice(EVENTS[stream], n)
+    return 'x'
+
+# One GENEActiv file per subject, with the device header before the data
+def write_actigraphy(raw_dir, rng, subject, start, days, rate):
+    make_dir(raw_dir)
+    path = os.path.join(raw_dir, '{S}_left wrist_012345_{D}.csv'.format(S=subject,
+        D=start.strftime('%Y-%m-%d %H-%M-%S')))
+    n = int(days * 86400 * rate)
+    timestamps = epoch_ms(start) + (np.arange(n) * 1000 / rate).astype(np.int64)
+    times = pd.to_datetime(timestamps, unit='ms')
+    df = pd.DataFrame({
+        'time': times.strftime('%Y-%m-%d %H:%M:%S:') +
+            pd.Index(timestamps % 1000).astype(str).str.zfill(3),
+        'x': rng.rand(n).round(4),
+        'y': rng.rand(n).round(4),
+        'z': rng.rand(n).round(4),
+        'lux': rng.randint(0, 500, n),
+        'button': 0,
+        'temperature': 25.0,
+    })
+    header = ''.join('Device header line {N}\n'.format(N=i) for i in range(100))
+    with open(path, 'w') as f:
+        f.write(header)
+        df.to_csv(f, index=False, header=False, columns=['time', 'x', 'y', 'z',
+            'lux', 'button', 'temperature'])
+
+# A scan session with one small DICOM file per instance and no pixel data
+def write_mri(raw_dir, rng, subject, start):
+    from pydicom.dataset import Dataset, FileDataset
+    from pydicom.uid import ImplicitVRLittleEndian
+
+    session = '{S}_MR_{D}'.format(S=subject, D=start.strftime('%y%m%d'))
+    scan_time = start + timedelta(hours=10)
+    for series_number, (description, tr, instances) in enumerate(MRI_SERIES, 1):
+        series_dir = make_dir(os.path.join(raw_dir, session,
+            '{N:03d}_{D}'.format(N=series_number, D=description)))
+        for instance in range(1, instances + 1):
+            meta = Dataset()
+            meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+            meta.MediaStorageSOPInstanceUID = '1.2.3.{S}.{I}'.format(
+                S=series_number, I=instance)
+            meta.TransferSyntaxUID = ImplicitVRLittleEndian
+            path = os.path.join(series_dir, '{N:05d}.dcm'.format(N=instance))
+            ds = FileDataset(path, {}, file_meta=meta, preamble=b'\0' * 128)
+            ds.is_little_endian = True
+            ds.is_implicit_VR = True
+            ds.AccessionNumber = session
+            ds.PatientID = subject
+            ds.PatientAge = '030Y'
+            ds.PatientWeight = round(60 + rng.rand() * 30, 1)
+            ds.StudyDate = scan_time.strftime('%Y%m%d')
+            ds.StudyTime = scan_time.strftime('%H%M%S.000000')
+            ds.SeriesDescription = description
+            ds.SeriesNumber = series_number
+            ds.InstanceNumber = instance
+            ds.RepetitionTime = tr
+            ds.EchoTime = 30.0
+            ds.SliceThickness = 2.0
+            ds.FlipAngle = 52.0
+            ds.Manufacturer = 'SIEMENS'
+            ds.ManufacturerModelName = 'Prisma_fit'
+            ds.DeviceSerialNumber = '12345'
+            ds.MagneticFieldStrength = 3.0
+            ds.SoftwareVersions = 'syngo MR E11'
+            ds.save_as(path)
+
+# Eye tracking, behavior, physio and interview files named after the session
+def write_sessions(subject_dir, subject, start, days):
+    for day in range(days):
+        date = (start + timedelta(days=day)).strftime('%y%m%d')
+        session = 'SESS{N}'.format(N=day + 1)
+
+        behav_dir = make_dir(os.path.join(subject_dir, 'mri_behav', 'raw'))
+        for task in ['rest', 'task1', 'task2']:
+            touch(os.path.join(behav_dir, '{S}_{D}_{N}_run_{T}.mat'.format(S=subject,
+                D=date, N=session, T=task)))
+
+        physio_dir = make_dir(os.path.join(subject_dir, 'physio', 'raw'))
+        touch(os.path.join(physio_dir, '{S}_{D}_{N}_run.acq'.format(S=subject,
+            D=date, N=session)))
+
+        eye_dir = make_dir(os.path.join(subject_dir, 'mri_eye', 'raw', 'eyeTracking'))
+        touch(os.path.join(eye_dir, '{S}_{D}_{N}.mov'.format(S=subject, D=date,
+            N=session)))
+        touch(os.path.join(eye_dir, '{S}_{D}_{N}_run_1_x.edf'.format(S=subject,
+            D=date, N=session)))
+
+        interview_dir = make_dir(os.path.join(subject_dir, 'onsite_interview',
+            'raw', '{S}_{D}'.format(S=subject, D=date)))
+        for n, extension in enumerate(['mp4', 'wav', 'mp4']):
+            touch(os.path.join(interview_dir, 'interview{N}.{E}.lock'.format(N=n,
+                E=extension)))
+
+# Watch swap assessments, one per day
+def write_surveys(raw_dir, subject, start, days):
+    make_dir(raw_dir)
+    records = [{'date_watch': (start + timedelta(days=day)).strftime('%Y-%m-%d'),
+        'time_watch_new': '12:00',
+        'watch_sampling_new': '30',
+        'watch_sampling_old': '30',
+        'hand_watch_new': str(day % 2)} for day in range(days)]
+    with open(os.path.join(raw_dir, '{S}.watchSwap.json'.format(S=subject)), 'w') as f:
+        json.dump(records, f)
+
+# Write a DataFrame as CSV, compressed if the path ends with .gz
+def write_csv(df, path):
+    text = df.to_csv(index=False)
+    if path.endswith('.gz'):
+        with gzip.open(path, 'wb') as f:
+            f.write(text.encode('utf-8'))
+    else:
+        with open(path, 'w') as f:
+            f.write(text)
+
+def file_name(timestamp, extension):
+    return timestamp.strftime('%Y-%m-%d %H_%M_%S') + extension
+
+def epoch_ms(timestamp):
+    return int((timestamp - EPOCH).total_seconds() * 1000)
+
+# Beiwe UTC time strings (ex. 2019-03-08T00:00:00.000)
+def utc_times(timestamps):
+    times = pd.to_datetime(timestamps, unit='ms')
+    return times.strftime('%Y-%m-%dT%H:%M:%S.') + \
+        pd.Index(timestamps % 1000).astype(str).str.zfill(3)
+
+def make_dir(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+def touch(path):
+    with open(path, 'w') as f:
+        f.write('x')
+
+if __name__ == '__main__':
+    main()
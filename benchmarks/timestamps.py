@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import argparse as ap
+from datetime import datetime
+
+# Benchmark the working tree rather than an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from logbook import tools
+
+import synthetic
+
+RESULT_FIELDS = ['stream', 'rows', 'per_row_sec', 'epoch_sec', 'string_sec',
+    'epoch_speedup', 'string_speedup']
+
+def parse_args():
+    argparser = ap.ArgumentParser('Time the timestamp conversion of each Beiwe stream')
+    argparser.add_argument('--stream', nargs='+', default=sorted(synthetic.SENSOR_STREAMS),
+        help='Streams to benchmark')
+    argparser.add_argument('--hours', type=int, default=1,
+        help='Hours of synthetic rows per stream')
+    argparser.add_argument('--rate', type=float, default=1.0,
+        help='Multiplier of the synthetic sampling rates')
+    argparser.add_argument('--output-tz', default='America/New_York',
+        help='Output time zone')
+    argparser.add_argument('--seed', type=int, default=1,
+        help='Random seed')
+    return argparser.parse_args()
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    start = datetime(2019, 3, 8)
+
+    results = []
+    for stream in args.stream:
+        columns, per_second = synthetic.SENSOR_STREAMS[stream]
+        n = max(1, int(per_second * args.rate * 3600 * args.hours))
+        df = synthetic.sensor_rows(stream, columns, rng, start, n)
+        results.append(run_benchmark(stream, df, args.output_tz))
+
+    print(pd.DataFrame(results, columns=RESULT_FIELDS).to_string(index=False))
+
+# Time the per-row conversion the streams used to do against the epoch and
+# UTC time paths of tools.process_timestamps, and check they agree
+def run_benchmark(stream, df, output_tz):
+    per_row, expected = timed(lambda: df['UTC time'].apply(
+        lambda x: pd.Timestamp(x, tz='UTC').tz_convert(output_tz)))
+    epoch, from_epoch = timed(lambda: tools.process_timestamps(df, 'UTC', output_tz))
+    # Any other input time zone name goes through the UTC time strings
+    string, from_string = timed(lambda: tools.process_timestamps(df, 'Etc/GMT+0',
+        output_tz))
+
+    if not (expected.equals(from_epoch) and expected.equals(from_string)):
+        raise ValueError('Timestamps of {S} differ'.format(S=stream))
+
+    return {
+        'stream': stream,
+        'rows': len(df),
+        'per_row_sec': round(per_row, 4),
+        'epoch_sec': round(epoch, 4),
+        'string_sec': round(string, 4),
+        'epoch_speedup': round(per_row / epoch, 1) if epoch else 0,
+        'string_speedup': round(per_row / string, 1) if string else 0,
+    }
+
+def timed(f):
+    start = time.time()
+    result = f()
+    return time.time() - start, result
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,33 @@ import os
 import argparse as ap
 import logging
 import re
+import time
+import cProfile
+import multiprocessing as mp
 from dateutil import tz
 from datetime import datetime
 from importlib import import_module
 
 from logbook import tools
+from logbook.__version__ import __version__
+from logbook.tools import aggregate
+from logbook.tools import beiwe
+from logbook.tools import cache
+from logbook.tools import instrument
+from logbook.tools import manifest as mf
+from logbook.tools import memory
+from logbook.tools import writers
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Job currently running in this process, used to tag log records
+CURRENT_JOB = '-'
+
+# Day 1 dates and sub-modules resolved once per process
+DATE_CACHE = {}
+MODULE_CACHE = {}
+TZ_CACHE = {}
+
 def parse_args():
     argparser = ap.ArgumentParser('LogBook Pipeline')
 
@@ -47,43 +66,269 @@ def parse_args():
     argparser.add_argument('--day-to',
         help='Output day to. (optional; By default, process data for all days)')
 
+    argparser.add_argument('--incremental',
+        help='Skip streams whose raw files and parameters did not change since the last run',
+        action='store_true')
+    argparser.add_argument('--manifest-dir',
+        help='Directory for the incremental run manifests. (Default: OUTPUT_DIR/.logbook)')
+    argparser.add_argument('--hash-inputs',
+        help='Compare raw file contents instead of modification times in incremental runs',
+        action='store_true')
+
+    argparser.add_argument('--memory-budget',
+        help='Memory budget in MB. Chunk sizes follow it and parsed rows are spilled to disk near it',
+        type=int)
+    argparser.add_argument('--spill-dir',
+        help='Directory for rows spilled under --memory-budget. (Default: system temporary directory)')
+    argparser.add_argument('--read-threads',
+        help='Number of threads decompressing and parsing the raw phone files. (Default: 1)',
+        type=int, default=1)
+    argparser.add_argument('--cache-dir',
+        help='Cache the parsed rows of raw phone files in this directory. (optional)')
+    argparser.add_argument('--hll-precision',
+        help='Count distinct wifi and bluetooth MACs with HyperLogLog sketches of 2^P '
+            'registers instead of exactly. (optional)',
+        type=int, metavar='P',
+        choices=range(aggregate.MIN_PRECISION, aggregate.MAX_PRECISION + 1))
+    argparser.add_argument('--output-format',
+        help='Format of the output files. (Default: csv)',
+        choices=sorted(writers.FORMATS), default=writers.CSV)
+
     return argparser
 
 def main(args):
+    day_from = int(args.day_from) if args.day_from not in [None, "None"] else None
+    day_to = int(args.day_to) if args.day_to not in [None, "None"] else None
+    manifest_dir = args.manifest_dir if args.manifest_dir != "None" else None
+
+    job = Job(args.study, args.subject, args.data_type,
+        read_dir=args.read_dir,
+        output_dir=args.output_dir,
+        date_from=args.date_from,
+        input_tz=args.input_tz,
+        output_tz=args.output_tz,
+        day_from=day_from,
+        day_to=day_to,
+        phone_streams=clean_phone_stream(args.phone_stream),
+        incremental=args.incremental,
+        manifest_dir=manifest_dir,
+        hash_inputs=args.hash_inputs,
+        memory_budget=args.memory_budget,
+        spill_dir=args.spill_dir,
+        read_threads=args.read_threads,
+        cache_dir=args.cache_dir,
+        hll_precision=args.hll_precision,
+        output_format=args.output_format)
+
+    return run_job(job)
+
+# A unit of work: one data type for one subject
+class Job(object):
+    def __init__(self, study, subject, data_type, read_dir, output_dir,
+            date_from, input_tz='UTC', output_tz='America/New_York',
+            day_from=None, day_to=None, phone_streams=None,
+            incremental=False, manifest_dir=None, hash_inputs=False, name=None,
+            profile=None, cost=None, memory_budget=None, spill_dir=None,
+            read_threads=1, cache_dir=None, hll_precision=None, output_format='csv'):
+        self.study = study
+        self.subject = subject
+        self.data_type = data_type
+        self.read_dir = read_dir
+        self.output_dir = output_dir
+        self.date_from = date_from
+        self.input_tz = input_tz
+        self.output_tz = output_tz
+        self.day_from = day_from
+        self.day_to = day_to
+        self.phone_streams = phone_streams if phone_streams else []
+        self.incremental = incremental
+        self.manifest_dir = manifest_dir
+        self.hash_inputs = hash_inputs
+        self.name = name if name else '/'.join([study, subject, data_type])
+        # Path of a cProfile dump for this job (optional)
+        self.profile = profile
+        # Estimated cost used to order the jobs (optional)
+        self.cost = cost
+        # Memory budget in MB, beyond which parsed rows are spilled (optional)
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        # Threads reading the raw phone files of the job
+        self.read_threads = read_threads
+        # Directory of the parse cache shared by the jobs (optional)
+        self.cache_dir = cache_dir
+        # Precision of the sketches counting distinct MACs (None: exact counts)
+        self.hll_precision = hll_precision
+        # Format of the output files (see logbook.tools.writers)
+        self.output_format = output_format
+
+    def __repr__(self):
+        return 'Job({N})'.format(N=self.name)
+
+# Run a batch of jobs, inline or in a process pool, and return their results
+def run_batch(jobs, processes=1):
+    if processes is None or processes < 2:
+        return [run_job(job) for job in jobs]
+
+    results = []
+    pool = mp.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(run_job, jobs, chunksize=1):
+            results.append(result)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return results
+
+# Run a single job and record its outcome
+def run_job(job):
+    global CURRENT_JOB
+    CURRENT_JOB = job.name
+
+    instrument.set_context(job.study, job.subject, job.data_type)
+
+    result = {'job': job.name, 'status': 'ok', 'error': '', 'elapsed': 0.0,
+        'cost': job.cost}
+    start = time.time()
+    try:
+        # Settings of the job (ex. an unknown output format) fail it alone
+        memory.set_budget(job.memory_budget, job.spill_dir)
+        beiwe.set_read_threads(job.read_threads)
+        cache.set_cache(job.cache_dir)
+        aggregate.set_precision(job.hll_precision)
+        writers.set_format(job.output_format)
+        if not profile_job(job):
+            result['status'] = 'skipped'
+    except Exception as e:
+        logger.exception(e)
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    result['elapsed'] = round(time.time() - start, 3)
+    result['stages'] = instrument.collect()
+    result['peak_rss_mb'] = round(memory.peak_rss() / 2.0 ** 20, 1)
+
+    logger.info('Finished {J} ({S}) in {T}s'.format(J=job.name,
+        S=result['status'], T=result['elapsed']))
+    CURRENT_JOB = '-'
+
+    return result
+
+# Process the job, under cProfile if requested
+def profile_job(job):
+    if job.profile is None:
+        return process_job(job)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(process_job, job)
+    finally:
+        profiler.dump_stats(job.profile)
+        logger.info('Wrote profile %s' % job.profile)
+
+# Process the data type of a job. Returns False if the job could not run
+def process_job(job):
     # Expand any ~/ in the directory paths
-    read_dir = os.path.expanduser(args.read_dir)
-    output_dir = os.path.expanduser(args.output_dir)
+    read_dir = os.path.expanduser(job.read_dir)
+    output_dir = os.path.expanduser(job.output_dir)
 
     # Perform sanity checks for inputs
-    date_from = check_date(args.date_from, args.output_tz)
-    if date_from is None: return
+    date_from = get_date_from(job.date_from, job.output_tz)
+    if date_from is None: return False
 
     read_dir = check_input(read_dir)
     output_dir = check_output(output_dir)
-    if read_dir is None or output_dir is None: return
-
-    day_from = int(args.day_from) if args.day_from != "None" else None
-    day_to = int(args.day_to) if args.day_to != "None" else None
+    if read_dir is None or output_dir is None: return False
 
     # Process data
-    data_type = args.data_type
-    phone_stream = clean_phone_stream(args.phone_stream)
+    data_type = job.data_type
+
+    mod = get_mod(data_type)
+    if mod is None: return False
 
-    mod = import_mod(data_type)
-    if mod is None: return
+    manifest = get_manifest(job, read_dir, output_dir,
+        date_from) if job.incremental else None
 
     if data_type == 'phone':
-        mod.process(data_type, args.study, args.subject, read_dir,
-            date_from, args.output_tz, args.input_tz,
-            day_from, day_to, args.output_dir, phone_stream)
+        mod.process(data_type, job.study, job.subject, read_dir,
+            date_from, job.output_tz, job.input_tz,
+            job.day_from, job.day_to, output_dir, job.phone_streams, manifest)
     else:
-        mod.process(data_type, args.study, args.subject, read_dir,
-            date_from, args.output_tz, args.input_tz,
-            day_from, day_to, args.output_dir)
+        if manifest is not None and manifest.unchanged(data_type, [read_dir]):
+            logger.info('Inputs unchanged. Skipping %s' % data_type)
+            return True
+
+        failed = tools.FAILED_EXPORTS
+        mod.process(data_type, job.study, job.subject, read_dir,
+            date_from, job.output_tz, job.input_tz,
+            job.day_from, job.day_to, output_dir)
+
+        # Inputs are read again by the next run when an output was not written
+        if manifest is not None and tools.FAILED_EXPORTS == failed:
+            manifest.update(data_type)
+            manifest.save()
+
+    return True
+
+# Load the manifest of the previous runs for the subject and data type
+def get_manifest(job, read_dir, output_dir, date_from):
+    manifest_dir = job.manifest_dir
+    if manifest_dir is None:
+        manifest_dir = mf.get_manifest_dir(output_dir)
+
+    params = {
+        'version': __version__,
+        'date_from': date_from.strftime('%Y-%m-%d'),
+        'input_tz': job.input_tz,
+        'output_tz': job.output_tz,
+        'day_from': job.day_from,
+        'day_to': job.day_to
+    }
+    # Approximate counts are a different output
+    if job.hll_precision is not None:
+        params['hll_precision'] = job.hll_precision
+    # Outputs in another format have to be written again
+    if job.output_format != writers.CSV:
+        params['output_format'] = job.output_format
+
+    return mf.get_manifest(os.path.expanduser(manifest_dir), job.study,
+        job.subject, job.data_type, read_dir, params, job.hash_inputs)
+
+# Resolve the day 1 date once per date and time zone
+def get_date_from(date_from, output_tz):
+    if isinstance(date_from, datetime):
+        return date_from
+
+    key = (str(date_from), output_tz)
+    if key not in DATE_CACHE:
+        DATE_CACHE[key] = check_date(str(date_from), output_tz)
+    return DATE_CACHE[key]
+
+# Import the sub-module of a data type once per process
+def get_mod(data_type):
+    if data_type not in MODULE_CACHE:
+        MODULE_CACHE[data_type] = import_mod(data_type)
+    return MODULE_CACHE[data_type]
+
+# Resolve a time zone name once per process
+def get_tz(name):
+    if name not in TZ_CACHE:
+        TZ_CACHE[name] = tz.gettz(name)
+        if TZ_CACHE[name] is None:
+            logger.error('Unknown time zone %s' % name)
+    return TZ_CACHE[name]
+
+# Tag each log record with the job that produced it
+class JobFilter(logging.Filter):
+    def filter(self, record):
+        record.job = CURRENT_JOB
+        return True
 
 # Parse stringified array to a list
 def clean_phone_stream(phone_stream):
-    if phone_stream == "None":
+    if phone_stream in [None, "None"]:
         return []
 
     phone_stream = phone_stream.split(",")
@@ -126,7 +371,7 @@ def check_date(date_from, output_tz):
         logger.warn('Please check the subject consent date.')
         return None
     try:
-        return datetime.strptime(date_from, '%Y-%m-%d').replace(tzinfo=tz.gettz(output_tz))
+        return datetime.strptime(date_from, '%Y-%m-%d').replace(tzinfo=get_tz(output_tz))
     except Exception as e:
         logger.error(e)
         logger.error('Error occurred while parsing the date-from parameter.')
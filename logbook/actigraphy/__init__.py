@@ -7,6 +7,8 @@ from datetime import datetime
 from dateutil import tz
 
 from logbook import tools
+from logbook.tools import instrument
+from logbook.tools import memory
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +24,10 @@ def process(data_type, study, subject, read_dir, date_from,
 
     input_tz = FILE_TIMEZONE
 
-    # Instantiate an empty dataframe
-    df = pd.DataFrame.from_records([])
+    # Collect the parsed rows
+    rows = memory.Accumulator()
 
-    for root_dir, dirs, files in os.walk(read_dir):
+    for root_dir, dirs, files in tools.walk_dir(read_dir):
         files[:] = [ f for f in files if not f[0] == '.' ]
         dirs[:] = [ d for d in dirs if not d[0] == '.' ]
 
@@ -33,11 +35,15 @@ def process(data_type, study, subject, read_dir, date_from,
             file_name, extension = verify(file_name)
             if file_name is not None:
                 file_path = os.path.join(root_dir, file_name)
-                for data in get_data(file_path, extension):
-                    data_list = parse(data, date_from, output_tz,
+                instrument.record('read_csv', files=1, bytes=tools.file_size(file_path), calls=0)
+                for data in instrument.timed(get_data(file_path, extension), 'read_csv'):
+                    with instrument.stage('parse', rows=len(data)):
+                        data_list = parse(data, date_from, output_tz,
                             input_tz, file_path, file_name)
-                    df = df.append(data_list, ignore_index=True, sort=False)
+                    with instrument.stage('accumulate'):
+                        rows.append(data_list)
 
+    df = rows.frame()
     if df is None or len(df) == 0:
         logger.warn('Data not found. Skipping data export and exiting.')
         return
@@ -45,15 +51,17 @@ def process(data_type, study, subject, read_dir, date_from,
     # Export seconds bin
     seconds_df = get_seconds_df(df, date_from)
     '''
-    tools.clean_output_dir_seconds(study, subject, output_dir, data_type, 'GENEActiv')
-    tools.export_data_seconds(seconds_df, study, subject,
+    output_path = tools.export_data_seconds(seconds_df, study, subject,
         output_dir, day_from, day_to, data_type, 'GENEActiv')
+    tools.clean_output_dir_seconds(study, subject, output_dir, data_type, 'GENEActiv',
+        keep=output_path)
     '''
     # Export daily bin
     daily_df = get_daily_df(seconds_df, date_from)
-    tools.clean_output_dir_daily(study, subject, output_dir, data_type, 'GENEActiv')
-    tools.export_data_daily(daily_df, study, subject,
+    output_path = tools.export_data_daily(daily_df, study, subject,
         output_dir, day_from, day_to, data_type, 'GENEActiv')
+    tools.clean_output_dir_daily(study, subject, output_dir, data_type, 'GENEActiv',
+        keep=output_path)
 
 
 def process_daily(df):
@@ -118,7 +126,7 @@ def csv_to_df(file_path):
     try:
         for chunk in pd.read_csv(file_path, keep_default_na=False, engine='c',
                 skiprows= SKIP_TO_DATA_ROW_NUM, skipinitialspace=True,
-                error_bad_lines=False, names=FILE_HEADERS, chunksize=CHUNKSIZE):
+                error_bad_lines=False, names=FILE_HEADERS, chunksize=memory.chunksize(CHUNKSIZE)):
             yield chunk
     except Exception as e:
         logger.error(e)
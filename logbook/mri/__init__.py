@@ -8,6 +8,8 @@ import math
 import pydicom as dicom
 
 from logbook import tools
+from logbook.tools import instrument
+from logbook.tools import memory
 
 logger = logging.getLogger(__name__)
 
@@ -16,39 +18,40 @@ def process(data_type, study, subject, read_dir, date_from, output_tz, input_tz,
     # Get all mri ids from the raw directory
     mri_ids = tools.scan_dir(read_dir)
 
-    # Instantiate an empty dataframe
-    df = pd.DataFrame.from_records([])
+    # Collect one row per series
+    rows = memory.Accumulator()
 
     for mri_id in sorted(mri_ids):
-        # Instantiate an empty dataframe
-        data = pd.DataFrame.from_records([])
-        processed_series = set()
+        # Row of each series of this session, by series number
+        series = {}
 
         logger.debug('Processing %s' % mri_id)
         temp = os.path.join(read_dir, mri_id)
 
-        for root_dir, dirs, files in os.walk(temp):
+        for root_dir, dirs, files in tools.walk_dir(temp):
             files[:] = [ f for f in files if not f[0] == '.' ]
             dirs[:] = [ d for d in dirs if not d[0] == '.' ]
 
             for file_name in sorted(files):
                 if file_name.endswith('.dcm'):
                     file_path = os.path.join(root_dir, file_name)
-                    dcm = get_data(file_path)
+                    with instrument.stage('read_dicom', files=1,
+                            bytes=tools.file_size(file_path)):
+                        dcm = get_data(file_path)
                     if dcm is not None and 'SeriesNumber' in dcm:
                         if dcm.SeriesDescription.startswith('SMS') or dcm.SeriesDescription.startswith('ASL') or (dcm.SeriesDescription.startswith('T1') and dcm.SeriesDescription.endswith('RMS')):
                             if not dcm.SeriesDescription.endswith('SBRef'):
-                                if dcm.SeriesNumber in processed_series:
-                                    data = add_slice_and_minutes(data, dcm.SeriesNumber,
+                                if dcm.SeriesNumber in series:
+                                    add_slice_and_minutes(series[dcm.SeriesNumber],
                                             dcm.InstanceNumber, dcm.RepetitionTime)
                                     continue
 
-                                processed_series.add(dcm.SeriesNumber)
                                 data_list = parse(dcm, date_from, output_tz,
                                     input_tz, file_path, file_name, study, subject)
-                                data = data.append(data_list, ignore_index=True, sort=False)
-        df = df.append(data, ignore_index=True, sort=False)
+                                series[dcm.SeriesNumber] = data_list
+                                rows.append(data_list)
 
+    df = rows.frame()
     if df is None or len(df) == 0:
         logger.warn('Data not found. Skipping data export and exiting.')
     else:
@@ -57,19 +60,15 @@ def process(data_type, study, subject, read_dir, date_from, output_tz, input_tz,
             output_dir, day_from, day_to, data_type)
 
 # Add slice number
-def add_slice_and_minutes(df, seriesNum, instanceNum, tr):
-    series_row = df.loc[df['seriesNum'] == seriesNum]
+def add_slice_and_minutes(row, instanceNum, tr):
+    if 'frameNum' not in row:
+        return row
 
-    frame_num = df.loc[df['seriesNum'] == seriesNum]['frameNum'].iloc[0]
-    new_frameNum = max(frame_num, instanceNum)
+    new_frameNum = max(row['frameNum'], instanceNum)
+    row['seriesDurationSec'] = max(tr * new_frameNum / 1000, row['seriesDurationSec'])
+    row['frameNum'] = new_frameNum
 
-    seriesDurationSec = series_row['seriesDurationSec'].iloc[0]
-    new_seriesDurationSec = max(tr * new_frameNum / 1000 , seriesDurationSec)
-
-    df.loc[df['seriesNum'] == seriesNum, 'seriesDurationSec'] = new_seriesDurationSec
-    df.loc[df['seriesNum'] == seriesNum, 'frameNum'] = new_frameNum
-
-    return df
+    return row
 
 # Final cleaning
 def clean_df(df):
@@ -8,6 +8,7 @@ from dateutil import tz
 from collections import Counter
 
 from logbook import tools
+from logbook.tools import memory
 
 logger = logging.getLogger(__name__)
 
@@ -27,10 +28,10 @@ def process(data_type, study, subject, read_dir, date_from,
     input_tz = FILE_TIMEZONE
     read_dir = os.path.join(read_dir, 'eyeTracking')
 
-    # Instantiate an empty dataframe
-    df = pd.DataFrame.from_records([])
+    # Collect the parsed rows
+    rows = memory.Accumulator()
 
-    for root_dir, dirs, files in os.walk(read_dir):
+    for root_dir, dirs, files in tools.walk_dir(read_dir):
         files[:] = [ f for f in files if not f[0] == '.' ]
         dirs[:] = [ d for d in dirs if not d[0] == '.' ]
 
@@ -40,8 +41,9 @@ def process(data_type, study, subject, read_dir, date_from,
                 continue
 
             data = get_data(task, session_date, session_id, category)
-            df = df.append(data, ignore_index=True, sort=False)
+            rows.append(data)
 
+    df = rows.frame()
     if df is None or len(df) == 0:
         logger.warn('Data not found. Skipping data export and exiting.')
         return
@@ -70,16 +72,18 @@ def process(data_type, study, subject, read_dir, date_from,
         ## Drop timeofday. The actual timeofday will be acquired from mri
         seconds_df = seconds_df.drop(columns=['timeofday'])
         '''
-        tools.clean_output_dir_seconds(study, subject, output_dir, data_type, cat)
-        tools.export_data_seconds(seconds_df, study, subject,
+        output_path = tools.export_data_seconds(seconds_df, study, subject,
             output_dir, day_from, day_to, data_type, cat)
+        tools.clean_output_dir_seconds(study, subject, output_dir, data_type, cat,
+            keep=output_path)
         '''
         # Export daily bin
         daily_df = get_daily_df(seconds_df, date_from)
 
-        tools.clean_output_dir_daily(study, subject, output_dir, data_type, cat)
-        tools.export_data_daily(daily_df, study, subject,
+        output_path = tools.export_data_daily(daily_df, study, subject,
             output_dir, day_from, day_to, data_type, cat)
+        tools.clean_output_dir_daily(study, subject, output_dir, data_type, cat,
+            keep=output_path)
 
 
 def count_files(df):
@@ -8,6 +8,7 @@ from dateutil import tz
 from collections import Counter
 
 from logbook import tools
+from logbook.tools import memory
 
 logger = logging.getLogger(__name__)
 
@@ -19,17 +20,17 @@ def process(data_type, study, subject, read_dir, date_from,
 
     input_tz = FILE_TIMEZONE
 
-    # Instantiate an empty dataframe
-    df = pd.DataFrame.from_records([])
+    # Collect the parsed rows
+    rows = memory.Accumulator()
 
     print('read_dir=%s, subject=%s' % (read_dir, subject))
     paths, dates = get_session_paths(read_dir, subject, output_tz, input_tz)
 
     for p, d in list(zip(paths, dates)):
         data = parse(p, d)
-        df = df.append(data, ignore_index=True, sort=False)
-
+        rows.append(data)
 
+    df = rows.frame()
     if df is None or len(df) == 0:
         logger.warn('Data not found. Skipping data export and exiting.')
         return
@@ -56,15 +57,17 @@ def process(data_type, study, subject, read_dir, date_from,
         ## Drop timeofday. The actual timeofday will be acquired from mri
         seconds_df = seconds_df.drop(columns=['timeofday'])
         '''
-        tools.clean_output_dir_seconds(study, subject, output_dir, data_type, cat)
-        tools.export_data_seconds(seconds_df, study, subject,
+        output_path = tools.export_data_seconds(seconds_df, study, subject,
             output_dir, day_from, day_to, data_type, cat)
+        tools.clean_output_dir_seconds(study, subject, output_dir, data_type, cat,
+            keep=output_path)
         '''
         # Export daily bin
         daily_df = get_daily_df(seconds_df, date_from)
-        tools.clean_output_dir_daily(study, subject, output_dir, data_type, cat)
-        tools.export_data_daily(daily_df, study, subject,
+        output_path = tools.export_data_daily(daily_df, study, subject,
             output_dir, day_from, day_to, data_type, cat)
+        tools.clean_output_dir_daily(study, subject, output_dir, data_type, cat,
+            keep=output_path)
 
 def process_daily(df):
     return df.groupby(['day', 'weekday', 'UTC_offset']).agg('sum').reset_index()
@@ -109,7 +112,7 @@ def expand_df(df):
 
 # Create daily df
 def parse(p, d):
-    files = [f for f in os.listdir(p) if os.path.isfile(os.path.join(p, f))]
+    files = tools.scan_files(p)
 
     df = get_extensions(files)
     df = expand_df(df)
@@ -134,7 +137,7 @@ def get_session_paths(read_dir, subject, output_tz, input_tz):
     session_paths = []
     session_dates = []
 
-    sessions = os.listdir(read_dir)
+    sessions = tools.scan_dir(read_dir)
 
     for session in sessions:
         if session in [ subject, 'MGH Clinical Session Videos' ]:
@@ -146,7 +149,7 @@ def get_session_paths(read_dir, subject, output_tz, input_tz):
             session_dates.extend(sub_dates)
             '''
         session_path = os.path.join(read_dir, session)
-        if not os.path.isdir(session_path):
+        if not tools.is_dir(session_path):
             logger.debug('%s is not a directory' % session_path)
             continue
 
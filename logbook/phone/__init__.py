@@ -4,11 +4,23 @@ from importlib import import_module
 import pandas as pd
 
 from logbook import tools
+from logbook.tools import aggregate
+from logbook.tools import beiwe
+from logbook.tools import instrument
+from logbook.tools import memory
+from logbook.tools import writers
 
 logger = logging.getLogger(__name__)
 
+# Columns of the per-second rows of every stream
+SECONDS_KEYS = ['day', 'weekday', 'timeofday', 'UTC_offset']
+# Raw rows counted at a time, and partial counts kept before they are merged
+BATCH_ROWS = 10 ** 5
+MERGE_PARTS = 32
+
 def process(data_type, study, subject, read_dir, date_from,
-        output_tz, input_tz, day_from, day_to, output_dir, phone_streams):
+        output_tz, input_tz, day_from, day_to, output_dir, phone_streams,
+        manifest=None):
     # beiwe_ids
     beiwe_ids = tools.scan_dir(read_dir)
     beiwe_data_types = get_beiwe_types(read_dir, beiwe_ids)
@@ -20,38 +32,78 @@ def process(data_type, study, subject, read_dir, date_from,
     for bdt in beiwe_data_types:
         if bdt in ['identifiers', 'reachability']:
             continue
-        df = pd.DataFrame.from_records([])
-
         mod = import_mod(bdt)
         if mod is None:
             continue
+        instrument.set_stream(bdt)
+
+        beiwe_paths = [os.path.join(read_dir, beiwe_id, bdt) for beiwe_id in beiwe_ids]
+        beiwe_paths = [p for p in beiwe_paths if tools.is_dir(p)]
+
+        if manifest is not None and manifest.unchanged(bdt, beiwe_paths):
+            logger.info('Inputs unchanged. Skipping %s' % bdt)
+            continue
 
-        for beiwe_id in beiwe_ids:
-            beiwe_path = os.path.join(read_dir, beiwe_id, bdt)
-            if not os.path.isdir(beiwe_path):
+        # Streams that reduce their rows to mergeable partials a batch at a
+        # time keep a running per-second aggregate instead of their raw rows
+        if hasattr(mod, 'partial_seconds'):
+            buffer = SecondsAggregate(mod, date_from)
+        else:
+            buffer = memory.SpillBuffer()
+        # Files of hours outside of the requested days are never opened
+        window = None
+        if day_from is not None or day_to is not None:
+            window = beiwe.DayWindow(date_from, day_from, day_to, output_tz, input_tz)
+        try:
+            for beiwe_path in beiwe_paths:
+                logger.info('Processing %s' % bdt)
+                beiwe.process(mod, beiwe_path,
+                    date_from, output_tz, input_tz, buffer, window)
+
+            skipped = window is not None and (window.before or window.after)
+            if len(buffer) == 0 and not skipped:
+                logger.warn('Data not found. Skipping data export and exiting.')
+                if manifest is not None:
+                    manifest.update(bdt)
+                    manifest.save()
                 continue
 
-            logger.info('Processing %s' % bdt)
-            data_list = mod.process(study, subject, beiwe_path,
-                date_from, output_tz, input_tz)
-            df = df.append(data_list, ignore_index=True, sort=False)
+            # Without rows in the window, the export still lists its days
+            # when files outside of it were skipped
+            if len(buffer) == 0:
+                logger.info('No data in {W} for {S}'.format(W=window, S=bdt))
+                daily_df = empty_daily_df(mod, date_from)
+            # Rows spilled to disk are aggregated a day at a time
+            elif isinstance(buffer, SecondsAggregate):
+                daily_df = get_daily_df(buffer.seconds_df(), date_from, bdt)
+            elif buffer.spilled:
+                daily_df = get_spilled_daily_df(buffer, date_from, mod)
+            else:
+                # Export seconds bin
+                seconds_df = get_seconds_df(buffer.frame(), date_from, mod)
+                '''
+                output_path = tools.export_data_seconds(seconds_df, study, subject,
+                    output_dir, day_from, day_to, data_type, bdt)
+                tools.clean_output_dir_seconds(study, subject, output_dir, data_type, bdt,
+                    keep=output_path)
+                '''
+                daily_df = get_daily_df(seconds_df, date_from, bdt)
+        finally:
+            buffer.close()
 
-        if df is None or len(df) == 0:
-            logger.warn('Data not found. Skipping data export and exiting.')
-            continue
+        if window is not None:
+            daily_df = pad_days(daily_df, window)
 
-        # Export seconds bin
-        seconds_df = get_seconds_df(df, date_from, mod)
-        '''
-        tools.clean_output_dir_seconds(study, subject, output_dir, data_type, bdt)
-        tools.export_data_seconds(seconds_df, study, subject,
-            output_dir, day_from, day_to, data_type, bdt)
-        '''
         # Export daily bin
-        daily_df = get_daily_df(seconds_df, date_from, bdt)
-        tools.clean_output_dir_daily(study, subject, output_dir, data_type, bdt)
-        tools.export_data_daily(daily_df, study, subject,
+        output_path = tools.export_data_daily(daily_df, study, subject,
             output_dir, day_from, day_to, data_type, bdt)
+        tools.clean_output_dir_daily(study, subject, output_dir, data_type, bdt,
+            keep=output_path)
+
+        # Streams whose output was not written are read again by the next run
+        if manifest is not None and output_path is not None:
+            manifest.update(bdt)
+            manifest.save()
 
 def process_daily(df):
     df = df.groupby(['day', 'weekday', 'UTC_offset']).agg('sum').reset_index()
@@ -59,18 +111,182 @@ def process_daily(df):
 
 # Process seconds data
 def get_seconds_df(df, date_from, mod):
-    seconds_data = tools.bin_df_seconds(df)
-    seconds_data = tools.parse_date_to(seconds_data, date_from)
-    seconds_data = seconds_data[pd.notnull(seconds_data['day'])]
-    seconds_data = mod.process_seconds(seconds_data)
-    seconds_data = tools.sort_seconds(seconds_data.reset_index())
+    seconds_data = date_seconds(df, date_from)
+    if len(seconds_data) == 0:
+        return seconds_data
+    with instrument.stage('process_seconds', rows=len(seconds_data)):
+        seconds_data = mod.process_seconds(seconds_data)
+        seconds_data = tools.sort_seconds(seconds_data.reset_index())
+        seconds_data = format_seconds(mod, seconds_data)
 
     return seconds_data
 
+# Write the time and UTC offset codes of processed seconds in their NCF form,
+# except for the offsets of streams that declare NUMERIC_OFFSETS
+def format_seconds(mod, df):
+    return tools.format_seconds(df, not getattr(mod, 'NUMERIC_OFFSETS', False))
+
+# Index rows by their second and add the codes of its day, weekday, time and
+# UTC offset, written out once the seconds are processed
+def date_seconds(df, date_from):
+    seconds_data = tools.bin_df_seconds(df)
+    seconds_data = tools.parse_date_codes(seconds_data, date_from)
+    return seconds_data[pd.notnull(seconds_data['day'])]
+
+# Running per-second aggregate of a stream whose rows can be reduced a batch
+# at a time to mergeable partials (partial_seconds, see logbook.tools.aggregate).
+# Raw rows are only kept until a batch is full, so memory follows the number
+# of seconds with data rather than of rows
+class SecondsAggregate(object):
+    spilled = False
+
+    def __init__(self, mod, date_from):
+        self.mod = mod
+        self.date_from = date_from
+        self.batch = memory.Accumulator()
+        self.parts = []
+        self.rows = 0
+        # Day and weekday are floats when a second could not be dated in one
+        # of the batches, as they would be with every row in one frame
+        self.float_keys = set()
+        self.empty = None
+
+    def append(self, data):
+        rows = len(self.batch)
+        self.batch.append(data)
+        self.rows += len(self.batch) - rows
+        if len(self.batch) >= memory.chunksize(BATCH_ROWS):
+            self.flush()
+
+    def __len__(self):
+        return self.rows
+
+    # Count the batched rows per second and merge them into the aggregate
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+        df = date_seconds(self.batch.frame(), self.date_from)
+        self.batch = memory.Accumulator()
+        self.float_keys.update(c for c in SECONDS_KEYS if df[c].dtype.kind == 'f')
+        if len(df) == 0:
+            self.empty = df
+            return
+
+        with instrument.stage('partial_seconds', rows=len(df)):
+            self.parts.append(self.mod.partial_seconds(df))
+            if len(self.parts) >= MERGE_PARTS:
+                self.parts = [merge_parts(self.parts)]
+
+    # Per-second rows of the stream
+    def seconds_df(self):
+        self.flush()
+        if not self.parts:
+            return self.empty if self.empty is not None else pd.DataFrame.from_records([])
+
+        partials = merge_parts(self.parts)
+        if isinstance(partials, dict):
+            seconds_data = dict((name, cast_keys(df, self.float_keys))
+                for name, df in partials.items())
+            rows = sum(len(df) for df in seconds_data.values())
+        else:
+            seconds_data = cast_keys(partials, self.float_keys).reset_index()
+            rows = len(seconds_data)
+        with instrument.stage('process_seconds', rows=rows):
+            seconds_data = self.mod.process_seconds(seconds_data)
+            seconds_data = tools.sort_seconds(seconds_data.reset_index())
+            seconds_data = format_seconds(self.mod, seconds_data)
+        return seconds_data
+
+    def close(self):
+        self.batch.close()
+        self.parts = []
+
+# Merge the partials of the batches, one by one for streams that keep several
+# (ex. counts, summaries and distinct values)
+def merge_parts(parts):
+    if isinstance(parts[0], dict):
+        return dict((name, aggregate.merge([p[name] for p in parts])) for name in parts[0])
+    return aggregate.merge(parts)
+
+# Turn the given levels of the index of a partial into floats
+def cast_keys(df, columns):
+    names = [n for n in df.index.names if n in columns]
+    if not names:
+        return df
+    levels = list(df.index.names)
+    df = df.reset_index()
+    for name in names:
+        df[name] = df[name].astype(float)
+    return df.set_index(levels)
+
 # Process daily data
 def get_daily_df(df, date_from, bdt):
-    daily_data = process_daily(df) if bdt != 'identifiers' else df
-    daily_data = daily_data.astype(str)
+    with instrument.stage('process_daily', rows=len(df)):
+        daily_data = process_daily(df) if bdt != 'identifiers' else df
+    return format_daily(daily_data)
+
+# Process daily data one day of spilled rows at a time
+def get_spilled_daily_df(buffer, date_from, mod):
+    days = []
+    for df in buffer.days():
+        seconds_data = get_seconds_df(df, date_from, mod)
+        if len(seconds_data) == 0:
+            continue
+        with instrument.stage('process_daily', rows=len(seconds_data)):
+            days.append(process_daily(seconds_data))
+    if not days:
+        return pd.DataFrame.from_records([])
+    return format_daily(memory.concat_days(days))
+
+# Days outside of the window were not read. Add an empty row at its last day
+# when files after it were skipped, or at the day before it when only files
+# before it were and it has no rows, so the export lists the days of the
+# window as it would have with them
+def pad_days(daily_df, window):
+    if window.after:
+        day = window.day_to
+    elif window.before and len(daily_df) == 0:
+        day = window.day_from - 1
+    else:
+        return daily_df
+    if len(daily_df) > 0 and daily_df['day'].max() >= day:
+        return daily_df
+    last_day = pd.DataFrame([day], columns=['day'])
+    return pd.concat([daily_df, last_day], ignore_index=True, sort=False)
+
+# Daily frame of a stream without rows. Streams whose rows have fixed
+# columns (counts of their REDUCER, or one row per file) are processed
+# without rows to get them. Others name their columns after the values of
+# their rows (ex. kinds of events), and only have the day columns
+def empty_daily_df(mod, date_from):
+    rows = empty_rows(mod)
+    if rows is None:
+        return format_daily(pd.DataFrame(columns=SECONDS_KEYS))
+
+    seconds_data = date_seconds(rows, date_from)
+    if hasattr(mod, 'partial_seconds'):
+        seconds_data = mod.partial_seconds(seconds_data).reset_index()
+    seconds_data = tools.sort_seconds(mod.process_seconds(seconds_data).reset_index())
+    return format_daily(process_daily(seconds_data))
+
+# Parsed rows of a stream with fixed columns, without any row
+def empty_rows(mod):
+    if beiwe.timestamp_source(mod) == beiwe.FILE_NAME:
+        df = pd.DataFrame({'counts': []})
+    elif getattr(mod, 'REDUCER', None) is not None:
+        df = pd.DataFrame(columns=list(mod.COLUMNS))
+    else:
+        return None
+
+    df['$date_to'] = pd.Series([], dtype='datetime64[ns, UTC]')
+    reducer = getattr(mod, 'REDUCER', None)
+    return reducer(df) if reducer is not None else df
+
+# Daily values are written as text in csv files (ex. 'nan' for missing
+# means), and keep their types in columnar outputs
+def format_daily(daily_data):
+    if writers.text():
+        daily_data = daily_data.astype(str)
     daily_data['day'] = daily_data['day'].astype(int)
     daily_data = tools.sort_daily(daily_data.reset_index())
 
@@ -82,7 +298,7 @@ def get_beiwe_types(read_dir, beiwe_ids):
     for i in beiwe_ids:
         if i[0] != '.':
             read_path = os.path.join(read_dir, i)
-            types = os.listdir(read_path)
+            types = tools.scan_dir(read_path)
             for t in types:
                 if t[0] != '.':
                     beiwe_data_types.add(t)
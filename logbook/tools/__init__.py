@@ -1,5 +1,6 @@
 from __future__ import division
 import os
+import errno
 import logging
 from glob import glob
 import pandas as pd
@@ -7,6 +8,10 @@ import numpy as np
 from decimal import Decimal
 from importlib import import_module
 
+from logbook.tools import instrument
+from logbook.tools import inventory
+from logbook.tools import writers
+
 logger = logging.getLogger(os.path.basename(__file__))
 
 DEFAULT_HEADERS = ['reftime', 'day', 'timeofday', 'weekday',
@@ -14,6 +19,12 @@ DEFAULT_HEADERS = ['reftime', 'day', 'timeofday', 'weekday',
 
 UNNECESSARY_HEADERS = ['$date_to', 'index', 'level_0']
 
+# Type of the numeric columns of a stream schema
+NUMERIC = 'numeric'
+
+# Names of the UTC time zone
+UTC_NAMES = ['UTC', 'ETC/UTC', 'GMT', 'ETC/GMT', 'UNIVERSAL', 'ZULU']
+
 # Get headers from the data
 def get_headers(data):
      new_headers = data.columns.values
@@ -28,12 +39,14 @@ def get_headers(data):
 
      return default_headers
 
+# Add a row for each day from 1 to the last one that has no data. Their cells
+# are left blank (NaN, written as empty cells), so numeric columns keep their
+# types. Columns are sorted by name
 def add_days(data):
     days = data['day'].unique()
-    max_day = max(days)
-    missing_days = [x for x in range(1, max_day + 1) if x not in days]
-    missing_days_df = pd.DataFrame(missing_days, columns=['day'])
-    data = data.append(missing_days_df, ignore_index=True).fillna('')
+    missing_days = np.setdiff1d(np.arange(1, max(days) + 1), days)
+    missing_days_df = pd.DataFrame({'day': missing_days})
+    data = pd.concat([data, missing_days_df], ignore_index=True, sort=True)
     return sort_daily(data)
 
 # Add columns for study, subject, data_type, and category
@@ -45,12 +58,19 @@ def finalize_data(data, study, subject, data_type, category):
     data['datatype'] = data_type
     data['category'] = category
 
-    for col in UNNECESSARY_HEADERS:
-        if col in data.columns.values:
-            data = data.drop([col], axis=1)
-    return data
+    return data.drop(columns=[c for c in UNNECESSARY_HEADERS if c in data.columns])
+
+# Exports that failed in this process, so that incremental runs do not record
+# the inputs of a data type whose outputs were not written
+FAILED_EXPORTS = 0
+
+def export_failed(e):
+    global FAILED_EXPORTS
+    FAILED_EXPORTS += 1
+    logger.error(e)
 
-# Export the data as daily binned csv file
+# Export the data as daily binned csv file. Returns its path, or None if
+# nothing was exported
 def export_data_daily(data, study, subject, output_dir, day_from, day_to, data_type, category):
     if len(data) == 0:
         logger.error('Data not found')
@@ -80,16 +100,19 @@ def export_data_daily(data, study, subject, output_dir, day_from, day_to, data_t
 
         print file_path
 
-        data.query(query).to_csv(path_or_buf=file_path,
-            index=False,
-            columns=default_headers,
-            na_rep='')
+        with instrument.stage('export', files=1) as stage:
+            data = data.query(query)
+            stage.rows = len(data)
+            writers.write(data, file_path, default_headers)
+
+        return file_path
 
     except Exception as e:
         print e
-        logger.error(e)
+        export_failed(e)
 
-# Export the data as seconds binned csv file
+# Export the data as seconds binned csv file. Returns its path, or None if
+# nothing was exported
 def export_data_seconds(data, study, subject, output_dir, day_from, day_to, data_type, category):
     if len(data) == 0:
         logger.error('Data not found')
@@ -119,16 +142,19 @@ def export_data_seconds(data, study, subject, output_dir, day_from, day_to, data
 
         print file_path
 
-        data.query(query).to_csv(path_or_buf=file_path,
-            index=False,
-            columns=default_headers,
-            na_rep='')
+        with instrument.stage('export', files=1) as stage:
+            data = data.query(query)
+            stage.rows = len(data)
+            writers.write(data, file_path, default_headers)
+
+        return file_path
 
     except Exception as e:
         print e
-        logger.error(e)
+        export_failed(e)
 
-# Export the data as csv file
+# Export the data as csv file. Returns its path, or None if
+# nothing was exported
 def export_mri_data(data, study, subject, output_dir, day_from, day_to, data_type, category):
     if len(data) == 0:
         logger.error('Data not found')
@@ -158,14 +184,16 @@ def export_mri_data(data, study, subject, output_dir, day_from, day_to, data_typ
 
         print file_path
 
-        data.query(query).to_csv(path_or_buf=file_path,
-            index=False,
-            columns=default_headers,
-            na_rep='')
+        with instrument.stage('export', files=1) as stage:
+            data = data.query(query)
+            stage.rows = len(data)
+            writers.write(data, file_path, default_headers)
+
+        return file_path
 
     except Exception as e:
         print e
-        logger.error(e)
+        export_failed(e)
 
 
 
@@ -229,16 +257,14 @@ def save_missingness(df_missed, study, subject, output_dir, frequencies, assessm
         file_name = '{ST}-{SB}-{DATA}_logbook{EXT}'.format(ST=study,
             SB=subject,
             DATA=assessment.title(),
-            EXT='.csv')
+            EXT=writers.extension())
 
         file_path = os.path.join(output_dir, file_name)
         logger.info('Writing %s' % file_path)
 
-        df_missed.to_csv(path_or_buf=file_path,
-            columns=frequencies,
-            na_rep='', index=False)
+        writers.write(df_missed, file_path, frequencies)
     except Exception as e:
-        logger.error(e)
+        export_failed(e)
 
 
 def camel_case(data_type):
@@ -258,7 +284,7 @@ def get_mri_filename(study, subject, data_type, day_from, day_to):
         DATA=data_type,
         DF=day_from,
         DT=day_to,
-        EXT='.csv')
+        EXT=writers.extension())
 
 def get_filename_seconds(study, subject, data_type, category, day_from, day_to):
     return '{ST}-{SB}-{DATA}_{CATE}_logbook_seconds-day{DF}to{DT}{EXT}'.format(ST=study,
@@ -267,7 +293,7 @@ def get_filename_seconds(study, subject, data_type, category, day_from, day_to):
         CATE=category,
         DF=day_from,
         DT=day_to,
-        EXT='.csv')
+        EXT=writers.extension())
 
 def get_filename_daily(study, subject, data_type, category, day_from, day_to):
     return '{ST}-{SB}-{DATA}_{CATE}_logbook_daily-day{DF}to{DT}{EXT}'.format(ST=study,
@@ -276,27 +302,31 @@ def get_filename_daily(study, subject, data_type, category, day_from, day_to):
         CATE=category,
         DF=day_from,
         DT=day_to,
-        EXT='.csv')
+        EXT=writers.extension())
 
-# Clean the output directory
-def clean_output_dir_daily(study, subject, output_dir, data_type, category):
+# Clean the output directory, except for the file just written (keep)
+def clean_output_dir_daily(study, subject, output_dir, data_type, category, keep=None):
     file_pattern = '{STUDY}-{SUBJECT}-{DATA}_{CATE}_logbook_daily-day*'.format(STUDY=study,
         SUBJECT=subject,
         DATA=data_type,
         CATE=category)
     file_path = os.path.join(output_dir, file_pattern)
     for match in glob(file_path):
+        if keep is not None and os.path.abspath(match) == os.path.abspath(keep):
+            continue
         logger.warn('Removing file %s' % match)
         os.remove(match)
 
-# Clean the output directory
-def clean_output_dir_seconds(study, subject, output_dir, data_type, category):
+# Clean the output directory, except for the file just written (keep)
+def clean_output_dir_seconds(study, subject, output_dir, data_type, category, keep=None):
     file_pattern = '{STUDY}-{SUBJECT}-{DATA}_{CATE}_logbook_seconds-day*'.format(STUDY=study,
         SUBJECT=subject,
         DATA=data_type,
         CATE=category)
     file_path = os.path.join(output_dir, file_pattern)
     for match in glob(file_path):
+        if keep is not None and os.path.abspath(match) == os.path.abspath(keep):
+            continue
         logger.warn('Removing file %s' % match)
         os.remove(match)
 
@@ -314,6 +344,10 @@ def sort_seconds(df):
 
 # Check if a directory is valid, then return its child directories
 def scan_dir(path):
+    inv = inventory.get_inventory(path)
+    if inv is not None:
+        return inv.listdir(path)
+
     if os.path.isdir(path):
         try:
             return os.listdir(path)
@@ -323,6 +357,56 @@ def scan_dir(path):
     else:
         return []
 
+# Return the names of the regular files in a directory
+def scan_files(path):
+    inv = inventory.get_inventory(path)
+    if inv is not None:
+        return [f.name for f in inv.tree.get(inventory.normalize(path), ([], []))[1]]
+
+    return [f for f in scan_dir(path) if os.path.isfile(os.path.join(path, f))]
+
+# Check if a path is a directory
+def is_dir(path):
+    inv = inventory.get_inventory(path)
+    if inv is not None:
+        return inv.isdir(path)
+
+    return os.path.isdir(path)
+
+# Return the size of a file in bytes
+def file_size(path):
+    inv = inventory.get_inventory(path)
+    entry = inv.entry(path) if inv is not None else None
+    if entry is not None:
+        return entry.size
+
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# Return the inventory entry of a file (its size and mtime), or a new one
+# when the file is outside of the inventory. None if it cannot be read
+def file_stat(path):
+    inv = inventory.get_inventory(path)
+    entry = inv.entry(path) if inv is not None else None
+    if entry is not None:
+        return entry
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return inventory.Entry(os.path.basename(path), path, stat.st_size, stat.st_mtime)
+
+# Walk a directory tree, using the inventory when available
+def walk_dir(path):
+    inv = inventory.get_inventory(path)
+    if inv is not None:
+        return inv.walk(path)
+
+    return os.walk(path)
+
 # Count the number of days between two dates
 def process_date(row_date, date_from):
     date_from = date_from.date()
@@ -332,6 +416,48 @@ def process_date(row_date, date_from):
     day = (date_to - date_from).days + 1
     return day
 
+# Convert the timestamps of a Beiwe file to the output time zone, one chunk at
+# a time. Beiwe writes the epoch in milliseconds next to its UTC time, so the
+# epoch is used when the input is UTC, and the UTC time otherwise
+def process_timestamps(df, input_tz, output_tz):
+    if is_utc(input_tz) and 'timestamp' in df.columns and df['timestamp'].dtype.kind in 'iu':
+        date_to = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+    else:
+        date_to = pd.to_datetime(df['UTC time']).dt.tz_localize(input_tz)
+    return date_to.dt.tz_convert(output_tz)
+
+def is_utc(tz_name):
+    return str(tz_name).upper() in UTC_NAMES
+
+# Create a directory and its parents, unless another process just did
+def make_dirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+    return path
+
+# Columns of a stream schema ({column: str, NUMERIC or None to infer}) to read
+# from a file. Columns missing from a file (ex. optional ones) are no error
+def usecols(columns):
+    return lambda column: column in columns
+
+# Keep the columns of a stream schema that a file has, for files read whole
+def select_columns(df, columns):
+    return df.drop(columns=[column for column in df.columns if column not in columns])
+
+# Types of the string columns of a stream schema, so they are not inferred
+def dtypes(columns):
+    return dict((column, kind) for column, kind in columns.items() if kind is str)
+
+# Coerce the numeric columns of a stream schema, blanks and bad values to NaN
+def to_numeric(df, columns):
+    for column, kind in columns.items():
+        if kind == NUMERIC and column in df.columns and df[column].dtype.kind not in 'iuf':
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
 # Return NCF style weekday..
 def process_weekday(row_date):
     weekday = row_date.isoweekday()
@@ -345,13 +471,98 @@ def process_utcoffset(row_date):
 
 # Get day, weekday, and timeofday based on the row index
 def parse_date_to(df, date_from):
-    df['day'] = df.index.map(lambda x: process_date(x, date_from))
-    df['weekday'] = df.index.map(process_weekday)
-    df['timeofday'] = df.index.map(process_time)
-    df['UTC_offset'] = df.index.map(process_utcoffset)
+    with instrument.stage('parse_date_to', rows=len(df)):
+        if len(df) == 0:
+            # Same (empty) columns and types as before
+            df['day'] = df.index.map(lambda x: process_date(x, date_from))
+            df['weekday'] = df.index.map(process_weekday)
+            df['timeofday'] = df.index.map(process_time)
+            df['UTC_offset'] = df.index.map(process_utcoffset)
+        else:
+            index = pd.DatetimeIndex(df.index)
+            wall = index.tz_localize(None) if index.tz is not None else index
+            missing = np.asarray(wall.isna())
+
+            # Days and weekdays are floats when a time is missing (NaT), as
+            # they were row by row
+            df['day'] = (wall.normalize() - pd.Timestamp(date_from.date())).days + 1
+            df['weekday'] = wall.dayofweek + 1
+            df['timeofday'] = times_of_day(wall, missing)
+            df['UTC_offset'] = utc_offsets(index, wall, missing)
+
+    return df[pd.notnull(df['day'])]
+
+# Get day, weekday, time of day and UTC offset of a time zone aware row index
+# as integer codes: int32 days, int8 weekdays, int32 seconds of the day and
+# int16 offsets written as signed HHMM numbers (-500 for -0500). They group
+# much faster than strings, and format_seconds writes them in their NCF form
+def parse_date_codes(df, date_from):
+    with instrument.stage('parse_date_to', rows=len(df)):
+        index = pd.DatetimeIndex(df.index)
+        wall = index.tz_localize(None) if index.tz is not None else index
+        missing = np.asarray(wall.isna())
+
+        day = np.asarray((wall.normalize() - pd.Timestamp(date_from.date())).days + 1)
+        weekday = np.asarray(wall.dayofweek + 1)
+        # Days and weekdays are floats when a time is missing, as they are
+        # with parse_date_to
+        if not missing.any():
+            day = day.astype(np.int32)
+            weekday = weekday.astype(np.int8)
+        df['day'] = day
+        df['weekday'] = weekday
+        df['timeofday'] = seconds_of_day(wall, missing).astype(np.int32)
+
+        minutes = (wall.asi8 - index.asi8) // (60 * 10 ** 9)
+        offsets = np.sign(minutes) * (np.abs(minutes) // 60 * 100 + np.abs(minutes) % 60)
+        df['UTC_offset'] = np.where(missing, 0, offsets).astype(np.int16)
 
     return df[pd.notnull(df['day'])]
 
+# Write the time of day and UTC offset codes of parse_date_codes in their NCF
+# form (ex. 08:05:00 and -0500). Offsets already turned into strings, or kept
+# as numbers with utc_offset=False, are left as they are
+def format_seconds(df, utc_offset=True):
+    if 'timeofday' in df.columns and df['timeofday'].dtype.kind in 'iu':
+        df['timeofday'] = time_table()[df['timeofday'].values]
+    if utc_offset and 'UTC_offset' in df.columns and df['UTC_offset'].dtype.kind in 'iu':
+        codes, uniques = pd.factorize(df['UTC_offset'])
+        labels = ['{S}{O:04d}'.format(S='-' if o < 0 else '+', O=abs(o)) for o in uniques]
+        df['UTC_offset'] = np.array(labels, dtype=object)[codes]
+    return df
+
+# NCF times of the seconds of a day, built on first use
+TIMES = None
+
+def time_table():
+    global TIMES
+    if TIMES is None:
+        TIMES = np.array(['{H:02d}:{M:02d}:{S:02d}'.format(H=s // 3600, M=s // 60 % 60,
+            S=s % 60) for s in range(24 * 3600)], dtype=object)
+    return TIMES
+
+# Second of the day of wall times (0 when missing)
+def seconds_of_day(wall, missing):
+    seconds = np.asarray(wall.hour * 3600 + wall.minute * 60 + wall.second)
+    return np.where(missing, 0, seconds).astype(np.int64)
+
+# NCF times of wall times, looked up from their second of the day
+def times_of_day(wall, missing):
+    times = time_table()[seconds_of_day(wall, missing)]
+    times[missing] = process_time(pd.NaT)
+    return times
+
+# UTC offsets of timestamps. A time zone has few offsets, so each distinct
+# one is formatted once, from the first timestamp that has it
+def utc_offsets(index, wall, missing):
+    offsets = pd.Series(wall.asi8 - index.asi8, dtype=float)
+    offsets[missing] = np.nan
+    codes, uniques = pd.factorize(offsets)
+    first = pd.Series(np.arange(len(codes))).groupby(codes).first()
+    # Missing times have the code -1, the last label
+    labels = [process_utcoffset(index[first[code]]) for code in range(len(uniques))]
+    return np.array(labels + [process_utcoffset(pd.NaT)], dtype=object)[codes]
+
 # Process time in NCF format
 def process_time(row_date):
     hour = str(row_date.hour) if row_date.hour > 9 else '0' + str(row_date.hour)
@@ -378,7 +589,8 @@ def bin_data(df, frequencies):
 # Bin data at seconds
 def bin_df_seconds(df):
     tool = import_tool('seconds')
-    data = tool.bin_df(df)
+    with instrument.stage('bin_seconds', rows=len(df)):
+        data = tool.bin_df(df)
     return df
 
 # Import tool module for the frequency
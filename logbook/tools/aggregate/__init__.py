@@ -0,0 +1,167 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Mergeable partial aggregates. A partial is a DataFrame indexed by the keys
+# of its groups and computed on a batch of rows (a chunk, a file or the rows
+# of a worker). merge() combines the partials of several batches into the
+# partial of all their rows, which the functions below then read
+
+# Columns of the summary of a numeric column: non-null count, sum, min, max
+# and the sum of squared deviations from the mean (M2, as in Welford's
+# algorithm), from which the mean and variance are read
+SUMMARY = ['count', 'sum', 'min', 'max', 'm2']
+
+# HyperLogLog sketches (Flajolet et al., 2007) of distinct values. A sketch
+# has 2 ** precision registers; each keeps the highest rank (position of the
+# first 1 bit) of the 64-bit hashes of the values that fall in it. Only the
+# registers that were hit are kept, as rows indexed by the keys followed by
+# the register, so small groups stay small. The relative standard error of a
+# count is about 1.04 / sqrt(2 ** precision): 1.6% at the precision of 12.
+# Below 2.5 * 2 ** precision values, counts come from the empty registers
+# (linear counting), within a few values of the exact count for groups of a
+# few hundred values
+SKETCH = ['rank']
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+# Precision of the sketches used by unique() in this process (None: exact)
+PRECISION = None
+
+# Set the precision of the sketches of the following jobs in this process
+def set_precision(precision=None):
+    global PRECISION
+    check_precision(precision)
+    PRECISION = precision
+
+# Raise a ValueError if a sketch precision is out of range
+def check_precision(precision):
+    if precision is not None and not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValueError('Sketch precision must be between {A} and {B}'.format(
+            A=MIN_PRECISION, B=MAX_PRECISION))
+
+# Number of rows in each group
+def counts(df, keys, name='counts'):
+    return df.groupby(keys).size().to_frame(name)
+
+# Summary of a numeric column in each group
+def summarize(df, keys, column):
+    grouped = df.groupby(keys)[column]
+    summary = grouped.agg(['count', 'sum', 'min', 'max'])
+    deviations = (df[column] - grouped.transform('mean')) ** 2
+    summary['m2'] = deviations.groupby([df[k] for k in keys]).sum()
+    return summary[SUMMARY]
+
+# Distinct non-null values of a column in each group, indexed by the keys
+# followed by the value
+def distinct(df, keys, column):
+    values = df[keys + [column]].dropna().drop_duplicates()
+    return values.set_index(keys + [column])
+
+# Distinct values of a column in each group, or a sketch of them when a
+# precision is set
+def unique(df, keys, column):
+    if PRECISION is None:
+        return distinct(df, keys, column)
+    return sketch(df, keys, column, PRECISION)
+
+# HyperLogLog sketch of the non-null values of a column in each group
+def sketch(df, keys, column, precision):
+    values = df[keys + [column]].dropna()
+    hashes = pd.util.hash_pandas_object(values[column], index=False).values
+    bits = 64 - precision
+    rest = hashes & np.uint64((1 << bits) - 1)
+
+    registers = values[keys].copy()
+    registers['register'] = (hashes >> np.uint64(bits)).astype(np.int32)
+    registers['rank'] = (bits - bit_length(rest) + 1).astype(np.int8)
+    return registers.groupby(keys + ['register'])[SKETCH].max()
+
+# Number of significant bits of unsigned 64-bit integers
+def bit_length(x):
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in [32, 16, 8, 4, 2, 1]:
+        high = (x >> np.uint64(shift)) > 0
+        length += shift * high
+        x = np.where(high, x >> np.uint64(shift), x)
+    return length + (x > 0)
+
+# Merge the partials of several batches of rows: distinct values are united,
+# sketches take the highest rank of each register, summaries are combined,
+# and any other column (counts) is summed
+def merge(parts):
+    df = pd.concat([p for p in parts if p is not None], sort=False)
+    levels = list(range(df.index.nlevels))
+
+    if len(df.columns) == 0:
+        return df[~df.index.duplicated()]
+    if list(df.columns) == SKETCH:
+        return df.groupby(level=levels).max()
+    if list(df.columns) == SUMMARY:
+        return merge_summaries(df, levels)
+    return df.groupby(level=levels).sum()
+
+# Combine summaries with the pairwise update of Chan et al.: the M2 of the
+# union adds the spread of each batch mean around the mean of the union
+def merge_summaries(df, levels):
+    grouped = df.groupby(level=levels)
+    merged = grouped.agg({'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'})
+
+    batch_mean = df['sum'] / df['count']
+    union_mean = (merged['sum'] / merged['count']).reindex(df.index)
+    spread = df['count'] * (batch_mean - union_mean) ** 2
+    merged['m2'] = grouped['m2'].sum() + spread.groupby(level=levels).sum()
+    return merged[SUMMARY]
+
+# Mean of each group of a summary (NaN without values)
+def mean(summary):
+    return summary['sum'] / summary['count']
+
+# Variance of each group of a summary (NaN with ddof values or fewer)
+def variance(summary, ddof=1):
+    var = summary['m2'] / (summary['count'] - ddof)
+    return var.where(summary['count'] > ddof)
+
+# Number of distinct values in each group, optionally for every group of an
+# index (0 for groups without values)
+def count_distinct(values, index=None):
+    levels = list(range(values.index.nlevels - 1))
+    counts = pd.Series(1, index=values.index).groupby(level=levels).sum()
+    if index is not None:
+        counts = counts.reindex(index, fill_value=0)
+    return counts
+
+# Estimated number of distinct values in each group of a sketch, rounded
+def count_sketch(registers, precision, index=None):
+    m = 2 ** precision
+    levels = list(range(registers.index.nlevels - 1))
+    ranks = registers['rank'].astype(float)
+    empty = m - ranks.groupby(level=levels).size()
+    harmonic = (2.0 ** -ranks).groupby(level=levels).sum() + empty
+
+    estimate = alpha(m) * m * m / harmonic
+    linear = m * np.log(m / empty.where(empty > 0).astype(float))
+    estimate = estimate.where(~((estimate <= 2.5 * m) & (empty > 0)), linear)
+
+    counts = estimate.round().astype(np.int64)
+    if index is not None:
+        counts = counts.reindex(index, fill_value=0)
+    return counts
+
+# Bias correction of the HyperLogLog estimate for m registers
+def alpha(m):
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+# Number of distinct values in each group of a unique() partial
+def count_unique(partial, index=None):
+    if list(partial.columns) == SKETCH:
+        return count_sketch(partial, PRECISION, index)
+    return count_distinct(partial, index)
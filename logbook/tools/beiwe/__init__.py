@@ -0,0 +1,331 @@
+import io
+import os
+import re
+import gzip
+import logging
+import numpy as np
+import pandas as pd
+from collections import deque
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from logbook import tools
+from logbook.tools import cache
+from logbook.tools import instrument
+from logbook.tools import memory
+
+logger = logging.getLogger(__name__)
+
+# Beiwe files are named after the hour they start
+FILE_REGEX = re.compile(r'(?P<year>[0-9]{4})-(?P<month>[0-9]{2})-(?P<day>[0-9]{2})\s(?P<hour>[0-9]{2})_(?P<minute>[0-9]{2})_(?P<second>[0-9]{2})(?P<extension>\..*)')
+CHUNKSIZE = 10 ** 6
+
+# Where the timestamps of a stream come from: the timestamp and UTC time
+# columns of each row, or the hour in the file name (one row per file)
+ROWS = 'rows'
+FILE_NAME = 'file name'
+
+# Declarations a stream module may leave out
+DEFAULT_EXTENSIONS = ['.csv', '.csv.gz']
+COMPRESSION = {'.csv.gz': 'gzip'}
+
+# Threads reading the raw files of a stream in this process, and files each
+# thread may have read ahead of the one being accumulated
+READ_THREADS = 1
+READ_AHEAD = 2
+
+# Hours a file may start beyond a day window and still be read, so no file
+# with rows in the window is skipped around time zone changes
+WINDOW_MARGIN = pd.Timedelta(hours=2)
+FILE_HOURS = pd.Timedelta(hours=1)
+
+# Set the number of threads reading the raw files of the following jobs
+def set_read_threads(threads=None):
+    global READ_THREADS
+    READ_THREADS = max(1, threads) if threads else 1
+
+# Parse every file of a stream under read_dir, as declared by the stream
+# module (EXTENSIONS, TIMESTAMP, COLUMNS and REDUCER), into the buffer.
+# With a DayWindow, files named after hours outside of it are not opened
+def process(mod, read_dir, date_from, output_tz, input_tz, buffer=None, window=None):
+    # Collect the parsed rows in the caller's buffer, or in a new one
+    buffer = buffer if buffer is not None else memory.SpillBuffer()
+
+    files = list(stream_files(mod, read_dir))
+    if window is not None:
+        kept = [(f, e) for f, e in files if window.keep(os.path.basename(f))]
+        if len(kept) < len(files):
+            logger.info('Skipped {N} files outside of {W}'.format(
+                N=len(files) - len(kept), W=window))
+        files = kept
+
+    if timestamp_source(mod) == FILE_NAME:
+        for file_path, extension in files:
+            with instrument.stage('parse', files=1, rows=1):
+                data_list = parse_file_name(os.path.basename(file_path), input_tz, output_tz)
+            with instrument.stage('accumulate'):
+                buffer.append(data_list)
+        return buffer
+
+    for data_list in parse_files(mod, files, output_tz, input_tz):
+        with instrument.stage('accumulate'):
+            buffer.append(data_list)
+
+    return buffer
+
+# Paths and extensions of the files of a stream under read_dir, in order
+def stream_files(mod, read_dir):
+    for root_dir, dirs, files in tools.walk_dir(read_dir):
+        files[:] = [ f for f in files if not f[0] == '.' ]
+        dirs[:] = [ d for d in dirs if not d[0] == '.' ]
+
+        for file_name in sorted(files):
+            file_name, extension = verify(mod, file_name)
+            if file_name is None:
+                continue
+            yield os.path.join(root_dir, file_name), extension
+
+# Parse the files in order. With more than one read thread, the following
+# files are decompressed and parsed in a pool while the current one is
+# accumulated, holding at most READ_AHEAD files per thread in memory
+def parse_files(mod, files, output_tz, input_tz):
+    if READ_THREADS < 2 or len(files) < 2:
+        for file_path, extension in files:
+            for data_list in parse_chunks(mod, file_path, extension, output_tz, input_tz):
+                yield data_list
+        return
+
+    pool = ThreadPool(READ_THREADS)
+    pending = deque()
+    try:
+        for file_path, extension in files:
+            pending.append(pool.apply_async(parse_file,
+                (mod, file_path, extension, output_tz, input_tz)))
+            if len(pending) >= READ_THREADS * READ_AHEAD:
+                for data_list in pending.popleft().get():
+                    yield data_list
+        while pending:
+            for data_list in pending.popleft().get():
+                yield data_list
+    finally:
+        pool.close()
+        pool.join()
+
+# Parsed chunks of a whole file, for the read threads
+def parse_file(mod, file_path, extension, output_tz, input_tz):
+    return list(parse_chunks(mod, file_path, extension, output_tz, input_tz))
+
+# Read and parse a file a chunk at a time, or take its rows from the cache
+def parse_chunks(mod, file_path, extension, output_tz, input_tz):
+    stat = tools.file_stat(file_path)
+    key = None
+    if stat is not None:
+        key = cache.key(file_path, stat.size, stat.mtime, mod.__name__, input_tz,
+            getattr(mod, 'COLUMNS', None))
+    if key is not None:
+        with instrument.stage('read_cache'):
+            cached = cache.load(key)
+        if cached is not None:
+            instrument.record('read_cache', rows=len(cached), files=1, calls=0)
+            yield localize(mod, cached, output_tz)
+            return
+
+    normalized = []
+    errors = []
+    instrument.record('read_csv', files=1, bytes=stat.size if stat else 0, calls=0)
+    for data in instrument.timed(read_chunks(mod, file_path, extension, errors), 'read_csv'):
+        with instrument.stage('parse', rows=len(data)):
+            data = normalize(mod, data, input_tz, file_path)
+            if data is not None and key is not None:
+                normalized.append(data.copy())
+            data_list = localize(mod, data, output_tz)
+        yield data_list
+
+    # Files read in part are parsed again by the next run
+    if normalized and not errors:
+        with instrument.stage('write_cache', files=1):
+            cache.store(key, pd.concat(normalized, ignore_index=True, sort=False))
+
+# Days day_from to day_to (either may be None), counted from date_from in the
+# output time zone, as the range of hours the files of those days start in.
+# File names are wall times in the input time zone, like the hours compared
+# with them here
+class DayWindow(object):
+
+    def __init__(self, date_from, day_from, day_to, output_tz, input_tz):
+        self.day_from = day_from
+        self.day_to = day_to
+        self.start = None
+        self.end = None
+        # A file holds the hour after the one it is named after
+        if day_from is not None:
+            self.start = wall_time(day_start(date_from, day_from, output_tz),
+                input_tz) - FILE_HOURS - WINDOW_MARGIN
+        if day_to is not None:
+            self.end = wall_time(day_start(date_from, day_to + 1, output_tz),
+                input_tz) + WINDOW_MARGIN
+        # Files skipped before and after the window
+        self.before = 0
+        self.after = 0
+
+    # Whether the file should be read, counting the ones that are not
+    def keep(self, file_name):
+        hour = file_hour(file_name)
+        if self.start is not None and hour < self.start:
+            self.before += 1
+            return False
+        if self.end is not None and hour >= self.end:
+            self.after += 1
+            return False
+        return True
+
+    def __str__(self):
+        return 'days {DF} to {DT}'.format(
+            DF=self.day_from if self.day_from is not None else '*',
+            DT=self.day_to if self.day_to is not None else '*')
+
+# Midnight starting a day counted from date_from, in the output time zone
+def day_start(date_from, day, output_tz):
+    date = date_from.date() + timedelta(days=day - 1)
+    return pd.Timestamp(date).tz_localize(output_tz, ambiguous=True,
+        nonexistent='shift_forward')
+
+# Wall time of a timestamp in another time zone
+def wall_time(timestamp, tz):
+    return timestamp.tz_convert(tz).tz_localize(None)
+
+# Hour a file is named after, as a wall time
+def file_hour(file_name):
+    match = FILE_REGEX.match(file_name).groupdict()
+    return pd.Timestamp(year=int(match['year']), month=int(match['month']),
+        day=int(match['day']), hour=int(match['hour']),
+        minute=int(match['minute']), second=int(match['second']))
+
+# Verify the file based on its filename
+def verify(mod, file_name):
+    match = FILE_REGEX.match(file_name)
+    if match and match.group('extension') in getattr(mod, 'EXTENSIONS', DEFAULT_EXTENSIONS):
+        return file_name, match.group('extension')
+    else:
+        return None, None
+
+def timestamp_source(mod):
+    return getattr(mod, 'TIMESTAMP', ROWS)
+
+# Read a file in chunks. A file that cannot be read is logged and its
+# chunks end early, with the error added to errors
+def read_chunks(mod, file_path, extension, errors):
+    try:
+        for chunk in read_csv(mod, file_path, extension):
+            yield chunk
+    except Exception as e:
+        logger.error(e)
+        logger.error('Could not read %s' % file_path)
+        errors.append(e)
+
+# Read a plain or gzipped csv file in chunks, with the declared columns
+def read_csv(mod, file_path, extension):
+    columns = getattr(mod, 'COLUMNS', None)
+    source = file_path
+    kwargs = {'compression': COMPRESSION.get(extension)}
+
+    if columns is not None:
+        text = read_bytes(file_path, extension)
+        source = io.BytesIO(text)
+        kwargs = read_args(text, columns)
+
+    for chunk in pd.read_csv(source, keep_default_na=False, engine='c',
+            skipinitialspace=True, error_bad_lines=False, index_col=False,
+            chunksize=memory.chunksize(getattr(mod, 'CHUNKSIZE', CHUNKSIZE)),
+            **kwargs):
+        if columns is not None:
+            chunk = tools.to_numeric(tools.select_columns(chunk, columns), columns)
+        yield chunk
+
+# Arguments of read_csv parsing only the declared columns of a file. pandas
+# does not count the fields of a line when it reads some columns, so the
+# lines with more fields than the header, which it skips otherwise, are
+# found in the raw text. Quoted fields may hold commas and line breaks, and
+# files with quotes are parsed whole
+def read_args(text, columns):
+    kwargs = {'dtype': tools.dtypes(columns)}
+    if b'"' in text:
+        return kwargs
+
+    kwargs['usecols'] = tools.usecols(columns)
+    skip = extra_field_lines(text)
+    if skip:
+        kwargs['skiprows'] = skip
+    return kwargs
+
+# Content of a plain or gzipped file
+def read_bytes(file_path, extension):
+    opener = gzip.open if COMPRESSION.get(extension) == 'gzip' else io.open
+    with opener(file_path, 'rb') as f:
+        return f.read()
+
+# Numbers of the lines (from 0, blank ones included) with more commas than
+# the header
+def extra_field_lines(text):
+    data = np.frombuffer(text, dtype=np.uint8)
+    ends = np.append(np.flatnonzero(data == ord('\n')), len(data))
+    commas = np.flatnonzero(data == ord(','))
+    fields = np.diff(np.append(0, np.searchsorted(commas, ends)))
+    return np.flatnonzero(fields > fields[0]).tolist()
+
+# Add the timestamp of each row in the output time zone, then reduce the
+# chunk with the stream's REDUCER, if any
+def parse(mod, df, output_tz, input_tz, file_path):
+    return localize(mod, normalize(mod, df, input_tz, file_path), output_tz)
+
+# Add the timestamp of each row in UTC and reduce the chunk. These rows do
+# not depend on the output time zone, and are the ones that are cached
+def normalize(mod, df, input_tz, file_path):
+    if df is None or len(df) == 0:
+        logger.error('Could not open file %s' % file_path)
+        return
+
+    df['$date_to'] = tools.process_timestamps(df, input_tz, 'UTC')
+    reducer = getattr(mod, 'REDUCER', None)
+    if reducer is not None:
+        return reducer(df)
+    return df
+
+# Convert normalized rows to the output time zone. Reduced rows are whole
+# seconds, and the seconds the output time zone repeats are dropped
+def localize(mod, df, output_tz):
+    if df is None:
+        return
+
+    df['$date_to'] = df['$date_to'].dt.tz_convert(output_tz)
+    if getattr(mod, 'REDUCER', None) is not None:
+        wall = df['$date_to'].dt.tz_localize(None)
+        df = df[wall.dt.tz_localize(output_tz, ambiguous='NaT').notna()]
+    return df
+
+# One row for a file, at the hour in its name
+def parse_file_name(file_name, input_tz, output_tz):
+    df = {}
+    df['$date_to'] = process_file_datetime(file_name, input_tz, output_tz)
+    df['counts'] = 1
+    return df
+
+# Return the timestamp of a file name in the timezone
+def process_file_datetime(file_name, input_tz, output_tz):
+    match = FILE_REGEX.match(file_name).groupdict()
+    timestamp = pd.Timestamp(year = int(match['year']),
+        month = int(match['month']),
+        day = int(match['day']),
+        hour = int(match['hour']),
+        minute = int(match['minute']),
+        second = int(match['second']),
+        nanosecond = 0,
+        tz = input_tz)
+    return timestamp.tz_convert(output_tz)
+
+# Reducer of the sensor streams: number of samples in each second
+def count_seconds(df):
+    processed = pd.DataFrame()
+    processed['$date_to'] = df['$date_to'].dt.floor('S', ambiguous='NaT').dropna()
+    processed = processed.groupby(['$date_to']).size().reset_index(name='data_points')
+    return processed
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import pandas as pd
+
+from logbook import tools
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the parsed rows of a raw file change shape
+CACHE_VERSION = 1
+CACHE_EXTENSION = '.pkl'
+TEMP_EXTENSION = '.tmp'
+# Age (seconds) of the temporary files left by jobs killed while storing an
+# entry, beyond which they are removed
+TEMP_AGE = 3600
+
+# Cache directory of the jobs running in this process (None: no cache), and
+# the total size (bytes) and age (seconds) beyond which entries are evicted
+CACHE_DIR = None
+MAX_BYTES = None
+MAX_AGE = None
+
+# Set the parse cache of the following jobs in this process
+def set_cache(cache_dir=None, max_mb=None, max_age_days=None):
+    global CACHE_DIR, MAX_BYTES, MAX_AGE
+    CACHE_DIR = os.path.expanduser(cache_dir) if cache_dir else None
+    MAX_BYTES = int(max_mb * 2 ** 20) if max_mb else None
+    MAX_AGE = max_age_days * 24 * 3600 if max_age_days else None
+
+def enabled():
+    return CACHE_DIR is not None
+
+# Cache key of a raw file: its path, size and mtime (as listed by the
+# inventory), and how it is parsed. Returns None when the cache is disabled
+def key(file_path, size, mtime, stream, input_tz, columns=None):
+    if CACHE_DIR is None:
+        return None
+
+    fields = [CACHE_VERSION, os.path.realpath(file_path), size, mtime, stream, input_tz,
+        sorted((c, str(t)) for c, t in (columns or {}).items())]
+    return hashlib.sha1(json.dumps(fields).encode('utf-8')).hexdigest()
+
+def entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + CACHE_EXTENSION)
+
+# Return the parsed rows stored under a key, or None on a miss
+def load(key):
+    path = entry_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_pickle(path)
+        # Entries are evicted by last use
+        os.utime(path, None)
+        return df
+    except Exception as e:
+        logger.error(e)
+        logger.error('Could not read cache entry %s' % path)
+        return None
+
+# Store the parsed rows of a raw file. Entries are written to a temporary
+# file first, so jobs sharing the cache never read a partial entry
+def store(key, df):
+    path = entry_path(key)
+    temp_path = '{P}.{PID}{T}'.format(P=path, PID=os.getpid(), T=TEMP_EXTENSION)
+    try:
+        tools.make_dirs(os.path.dirname(path))
+        df.to_pickle(temp_path)
+        os.rename(temp_path, path)
+    except Exception as e:
+        logger.error(e)
+        logger.error('Could not write cache entry %s' % path)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Remove the temporary files of entries never stored, then the entries
+# older than the maximum age, then the least recently used ones until the
+# cache fits in its maximum size
+def evict():
+    if CACHE_DIR is None or not os.path.isdir(CACHE_DIR):
+        return
+
+    now = time.time()
+    entries = []
+    orphans = 0
+    for root_dir, dirs, files in os.walk(CACHE_DIR):
+        for file_name in files:
+            path = os.path.join(root_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if file_name.endswith(TEMP_EXTENSION):
+                if now - stat.st_mtime > TEMP_AGE and remove(path):
+                    orphans += 1
+            elif file_name.endswith(CACHE_EXTENSION):
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    if orphans:
+        logger.info('Removed {N} temporary cache files'.format(N=orphans))
+    if MAX_BYTES is None and MAX_AGE is None:
+        return
+
+    total = sum(size for mtime, size, path in entries)
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        expired = MAX_AGE is not None and now - mtime > MAX_AGE
+        oversized = MAX_BYTES is not None and total > MAX_BYTES
+        if not expired and not oversized:
+            break
+        remove(path)
+        total -= size
+        removed += 1
+
+    logger.info('Evicted {N} cache entries, {M} MB left in {D}'.format(
+        N=removed, M=round(total / 2.0 ** 20, 1), D=CACHE_DIR))
+
+# Remove a file, unless another job already did
+def remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
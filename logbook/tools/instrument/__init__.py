@@ -0,0 +1,103 @@
+import os
+import csv
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_FIELDS = ['study', 'subject', 'data_type', 'stream']
+COUNTER_FIELDS = ['calls', 'seconds', 'rows', 'bytes', 'files']
+REPORT_FIELDS = ['job'] + CONTEXT_FIELDS + ['stage'] + COUNTER_FIELDS
+
+# Study, subject, data type and stream being processed in this process
+CONTEXT = dict((f, '') for f in CONTEXT_FIELDS)
+
+# (context, stage) -> counters, accumulated until collected
+STAGES = {}
+# Stages may be recorded by the threads reading raw files
+LOCK = threading.Lock()
+
+# Times a block and adds its counters to the current context and stage
+class stage(object):
+    def __init__(self, name, rows=0, bytes=0, files=0):
+        self.name = name
+        self.rows = rows
+        self.bytes = bytes
+        self.files = files
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.time() - self.start, self.rows, self.bytes, self.files)
+        return False
+
+# Set the context of the following stages; stream is reset unless given
+def set_context(study='', subject='', data_type='', stream=''):
+    CONTEXT.update(study=study, subject=subject, data_type=data_type, stream=stream)
+
+def set_stream(stream):
+    CONTEXT['stream'] = stream
+
+# Add counters to a stage
+def record(name, seconds=0.0, rows=0, bytes=0, files=0, calls=1):
+    key = tuple(CONTEXT[f] for f in CONTEXT_FIELDS) + (name,)
+    with LOCK:
+        counters = STAGES.setdefault(key, dict((f, 0) for f in COUNTER_FIELDS))
+        counters['calls'] += calls
+        counters['seconds'] += seconds
+        counters['rows'] += rows
+        counters['bytes'] += bytes
+        counters['files'] += files
+
+# Time each step of an iterator of DataFrames, counting their rows
+def timed(iterable, name):
+    if iterable is None:
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(name, time.time() - start, calls=0)
+            return
+        record(name, time.time() - start, rows=len(item) if item is not None else 0)
+        yield item
+
+# Return the stages recorded so far as a list of dicts and reset them
+def collect():
+    stages = []
+    for key, counters in sorted(STAGES.items()):
+        row = dict(zip(CONTEXT_FIELDS + ['stage'], key))
+        row.update(counters)
+        row['seconds'] = round(row['seconds'], 6)
+        stages.append(row)
+    STAGES.clear()
+    return stages
+
+# Write the stages of a run as JSON or CSV, depending on the file extension
+def write_report(path, results):
+    rows = []
+    for result in results:
+        for row in result.get('stages', []):
+            row = dict(row)
+            row['job'] = result['job']
+            rows.append(row)
+
+    try:
+        with open(path, 'w') as f:
+            if path.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump({'jobs': [dict((k, v) for k, v in r.items() if k != 'stages')
+                    for r in results], 'stages': rows}, f, indent=1, sort_keys=True)
+        logger.info('Wrote run report %s' % path)
+    except Exception as e:
+        logger.error(e)
+        logger.error('Could not write run report %s' % path)
@@ -0,0 +1,196 @@
+import os
+import logging
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+logger = logging.getLogger(__name__)
+
+# Depth below each root at which subtrees are handed to the thread pool
+# (PHOENIX/<directory>/<study>/<subject>)
+PARALLEL_DEPTH = 3
+
+Entry = namedtuple('Entry', ['name', 'path', 'size', 'mtime'])
+
+# Inventory shared by every module in this process
+ACTIVE = None
+
+# In-memory index of a directory tree, built in one pass with scandir
+class Inventory(object):
+    def __init__(self):
+        self.roots = []
+        # directory path -> (list of subdirectory names, list of file entries)
+        self.tree = {}
+        # directory path -> {file name: file entry}, built on demand
+        self.names = {}
+
+    # Scan a directory tree and add it to the index
+    def scan(self, root, threads=1):
+        root = normalize(root)
+        if not os.path.isdir(root):
+            logger.warn('%s is not a directory' % root)
+            return self
+
+        pending = [root]
+        for depth in range(PARALLEL_DEPTH):
+            pending = [child for path in pending for child in self.scan_level(path)]
+
+        if threads > 1 and len(pending) > 1:
+            pool = ThreadPool(threads)
+            try:
+                subtrees = pool.map(scan_tree, pending, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            subtrees = [scan_tree(path) for path in pending]
+
+        for subtree in subtrees:
+            self.tree.update(subtree)
+        self.roots.append(root)
+
+        logger.info('Indexed {D} directories and {F} files under {R}'.format(
+            D=len(self.tree), F=sum(len(f) for d, f in self.tree.values()), R=root))
+        return self
+
+    # Index a single directory and return the paths of its subdirectories
+    def scan_level(self, path):
+        dirs, files, links = list_entries(path)
+        self.tree[path] = (dirs, files)
+        return subdirs(path, dirs, links)
+
+    # Check if the path falls under one of the indexed roots
+    def covers(self, path):
+        path = normalize(path)
+        for root in self.roots:
+            if path == root or path.startswith(root + os.sep):
+                return True
+        return False
+
+    def isdir(self, path):
+        return normalize(path) in self.tree
+
+    # Return the names of the children of a directory
+    def listdir(self, path):
+        node = self.tree.get(normalize(path))
+        if node is None:
+            return []
+        dirs, files = node
+        return list(dirs) + [f.name for f in files]
+
+    # Mirror os.walk, including in-place pruning of dirs and files
+    def walk(self, path):
+        path = normalize(path)
+        node = self.tree.get(path)
+        if node is None:
+            return
+        dirs = list(node[0])
+        files = [f.name for f in node[1]]
+        yield path, dirs, files
+        for d in dirs:
+            for item in self.walk(os.path.join(path, d)):
+                yield item
+
+    # Return every file entry under a directory
+    def files(self, path):
+        for root_dir, dirs, files in self.walk(path):
+            dirs[:] = [d for d in dirs if not d[0] == '.']
+            for entry in self.tree[root_dir][1]:
+                if not entry.name[0] == '.':
+                    yield entry
+
+    # Return the entry of a single file
+    def entry(self, path):
+        path = normalize(path)
+        parent, name = os.path.split(path)
+        if parent not in self.names:
+            node = self.tree.get(parent, ([], []))
+            self.names[parent] = dict((f.name, f) for f in node[1])
+        return self.names[parent].get(name)
+
+    # Total size in bytes of the files under a directory
+    def size(self, path):
+        return sum(f.size for f in self.files(path))
+
+# Build an inventory for one or more roots
+def build_inventory(roots, threads=1):
+    inventory = Inventory()
+    for root in roots:
+        inventory.scan(root, threads)
+    return inventory
+
+# Make the inventory visible to every module in this process
+def set_inventory(inventory):
+    global ACTIVE
+    ACTIVE = inventory
+
+# Return the active inventory if it covers the path
+def get_inventory(path):
+    if ACTIVE is not None and ACTIVE.covers(path):
+        return ACTIVE
+    return None
+
+# Return every file entry under a directory, from the inventory when available
+def list_files(path):
+    inv = get_inventory(path)
+    if inv is None:
+        inv = Inventory()
+        inv.tree = scan_tree(normalize(path))
+    return inv.files(path)
+
+# Scan a subtree and return its part of the index
+def scan_tree(root):
+    tree = {}
+    pending = [root]
+    while pending:
+        path = pending.pop()
+        dirs, files, links = list_entries(path)
+        tree[path] = (dirs, files)
+        pending.extend(subdirs(path, dirs, links))
+    return tree
+
+# Return the subdirectories to descend into, skipping symlinks that loop back
+def subdirs(path, dirs, links):
+    children = []
+    for d in dirs:
+        child = os.path.join(path, d)
+        if d in links:
+            target = os.path.realpath(child)
+            if (os.path.realpath(path) + os.sep).startswith(target + os.sep):
+                logger.warn('Skipping symlink loop %s' % child)
+                continue
+        children.append(child)
+    return children
+
+# List a directory into sorted subdirectory names, file entries and the
+# names of symlinked subdirectories
+def list_entries(path):
+    dirs = []
+    files = []
+    links = set()
+    try:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                    if entry.is_symlink():
+                        links.add(entry.name)
+                else:
+                    stat = entry.stat()
+                    files.append(Entry(entry.name, entry.path,
+                        stat.st_size, stat.st_mtime))
+            except OSError as e:
+                logger.error(e)
+    except OSError as e:
+        logger.error(e)
+
+    dirs.sort()
+    files.sort(key=lambda f: f.name)
+    return dirs, files, links
+
+def normalize(path):
+    return os.path.normpath(os.path.abspath(os.path.expanduser(path)))
@@ -0,0 +1,134 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+
+from logbook import tools
+from logbook.tools import inventory
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = '.logbook'
+HASH_BLOCKSIZE = 2 ** 20
+
+# Persistent record of the raw files and parameters behind each output, used to
+# skip streams whose inputs have not changed since the last run
+class Manifest(object):
+    def __init__(self, path, params, hash_files=False):
+        self.path = path
+        self.params = params
+        self.hash_files = hash_files
+        self.pending = {}
+        self.updated = set()
+        self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f).get('entries', {})
+        except Exception as e:
+            logger.error(e)
+            logger.error('Could not read manifest %s' % self.path)
+            return {}
+
+    # Check if the inputs and parameters of a stream match the last run
+    def unchanged(self, key, read_dirs):
+        previous = self.entries.get(key, {})
+        files = fingerprint(read_dirs, self.hash_files, previous.get('files', {}))
+        self.pending[key] = {'params': self.params, 'files': files}
+
+        if not files or previous.get('params') != self.params:
+            return False
+        return same_files(previous.get('files', {}), files, self.hash_files)
+
+    # Record the inputs of a stream once it has been processed
+    def update(self, key):
+        if key in self.pending:
+            self.entries[key] = self.pending.pop(key)
+            self.updated.add(key)
+
+    # Write the streams updated here on top of the manifest on disk, which
+    # jobs for other streams of the subject may have saved in the meantime.
+    # The manifest is locked from reading to writing, so that concurrent
+    # saves do not lose each other's streams
+    def save(self):
+        try:
+            tools.make_dirs(os.path.dirname(self.path))
+            with locked(self.path + '.lock'):
+                entries = self.load()
+                entries.update((key, self.entries[key]) for key in self.updated)
+                self.entries = entries
+                temp_path = '{P}.{PID}.tmp'.format(P=self.path, PID=os.getpid())
+                with open(temp_path, 'w') as f:
+                    json.dump({'entries': self.entries}, f, sort_keys=True)
+                os.rename(temp_path, self.path)
+        except Exception as e:
+            logger.error(e)
+            logger.error('Could not write manifest %s' % self.path)
+
+# Hold an exclusive lock on a file, waiting for other processes to release it
+@contextmanager
+def locked(path):
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+# Return the manifest for a subject and data type
+def get_manifest(manifest_dir, study, subject, data_type, read_dir, params,
+        hash_files=False):
+    read_dir = inventory.normalize(read_dir)
+    read_hash = hashlib.sha1(read_dir.encode('utf-8')).hexdigest()[:8]
+    file_name = '{ST}-{SB}-{DATA}_manifest_{H}.json'.format(ST=study,
+        SB=subject,
+        DATA=data_type,
+        H=read_hash)
+    return Manifest(os.path.join(manifest_dir, file_name), params, hash_files)
+
+# Default location of the manifests for an output directory
+def get_manifest_dir(output_dir):
+    return os.path.join(output_dir, MANIFEST_DIR)
+
+# Size, mtime and optionally content hash of every raw file in the directories
+def fingerprint(read_dirs, hash_files=False, previous={}):
+    files = {}
+    for read_dir in read_dirs:
+        for entry in inventory.list_files(read_dir):
+            files[entry.path] = [entry.size, entry.mtime]
+            if hash_files:
+                files[entry.path].append(file_hash(entry, previous.get(entry.path)))
+    return files
+
+# Compare sizes and content hashes, or sizes and mtimes when not hashing
+def same_files(previous, current, hash_files=False):
+    if set(previous.keys()) != set(current.keys()):
+        return False
+
+    field = 2 if hash_files else 1
+    for path, stat in current.items():
+        old = previous[path]
+        if len(old) <= field or old[0] != stat[0] or old[field] != stat[field]:
+            return False
+    return True
+
+# Reuse the previous hash when the size and mtime did not change
+def file_hash(entry, previous):
+    if previous is not None and len(previous) > 2:
+        if previous[0] == entry.size and previous[1] == entry.mtime:
+            return previous[2]
+
+    sha = hashlib.sha1()
+    try:
+        with open(entry.path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCKSIZE), b''):
+                sha.update(block)
+    except Exception as e:
+        logger.error(e)
+        return ''
+    return sha.hexdigest()
@@ -0,0 +1,225 @@
+import os
+import shutil
+import logging
+import resource
+import tempfile
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Share of the budget left after startup that buffered rows may use before
+# they are spilled, and share used for a single chunk of a raw file
+BUFFER_FRACTION = 0.5
+CHUNK_FRACTION = 0.1
+# Smallest chunk read from a raw file, in rows
+MIN_CHUNKSIZE = 10 ** 4
+# Memory of a parsed row, in bytes, until one has been measured
+ROW_BYTES = 512
+SPILL_PREFIX = 'logbook-spill-'
+NAT_PARTITION = 'NaT'
+
+# Budget in bytes of the job running in this process, and where to spill
+BUDGET = None
+SPILL_DIR = None
+# Bytes per parsed row, measured on the rows buffered so far
+ROW_SIZE = {'bytes': 0, 'rows': 0}
+
+# Set the memory budget (MB) of the following jobs in this process
+def set_budget(budget_mb=None, spill_dir=None):
+    global BUDGET, SPILL_DIR
+    BUDGET = int(budget_mb * 2 ** 20) if budget_mb else None
+    SPILL_DIR = spill_dir
+
+# Bytes available to the data of a job
+def available():
+    if BUDGET is None:
+        return None
+    return max(BUDGET - rss(), 0)
+
+# Rows to read at a time from a raw file, so a chunk fits in the budget
+def chunksize(default):
+    free = available()
+    if free is None:
+        return default
+    rows = int(free * CHUNK_FRACTION / row_bytes())
+    return max(MIN_CHUNKSIZE, min(default, rows))
+
+def row_bytes():
+    if ROW_SIZE['rows'] == 0:
+        return ROW_BYTES
+    return max(1, ROW_SIZE['bytes'] // ROW_SIZE['rows'])
+
+# Resident set size of this process in bytes
+def rss():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError):
+        return peak_rss()
+
+# Peak resident set size of this process in bytes
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname()[0] == 'Darwin' else peak * 1024
+
+# Parsed rows collected as a list of DataFrames and single rows, and put
+# together once, instead of growing a DataFrame with append (which copies all
+# the rows gathered so far every time)
+class Accumulator(object):
+    def __init__(self):
+        self.frames = []
+        self.records = []
+        self.rows = 0
+
+    # Add a DataFrame of rows, or a single row as a dict. Empty DataFrames
+    # still add their columns
+    def append(self, data):
+        if data is None:
+            return
+        if isinstance(data, dict):
+            self.records.append(data)
+            self.rows += 1
+            return
+        self.collect()
+        self.frames.append(data)
+        self.rows += len(data)
+
+    def __len__(self):
+        return self.rows
+
+    # All the rows in one DataFrame
+    def frame(self):
+        frames = self.collect()
+        if not frames:
+            return pd.DataFrame.from_records([])
+        return pd.concat(frames, ignore_index=True, sort=False)
+
+    # Collected frames, with single rows turned into a DataFrame
+    def collect(self):
+        if self.records:
+            self.frames.append(pd.DataFrame.from_records(self.records))
+            self.records = []
+        return self.frames
+
+    def close(self):
+        self.frames = []
+        self.records = []
+
+# Parsed rows of a stream, kept in memory until they outgrow the budget and
+# then spilled to disk one file per local day, so they can be aggregated a
+# day at a time
+class SpillBuffer(Accumulator):
+    def __init__(self, date_column='$date_to'):
+        super(SpillBuffer, self).__init__()
+        self.date_column = date_column
+        self.bytes = 0
+        self.limit = None
+        free = available()
+        if free is not None:
+            self.limit = int(free * BUFFER_FRACTION)
+        self.spill_dir = None
+        # local day -> spilled file paths
+        self.spills = {}
+
+    def append(self, data):
+        if data is None or isinstance(data, dict):
+            return super(SpillBuffer, self).append(data)
+        if len(data) == 0:
+            return
+
+        size = data.memory_usage(index=True, deep=True).sum()
+        ROW_SIZE['bytes'] += size
+        ROW_SIZE['rows'] += len(data)
+        self.collect()
+        self.frames.append(data)
+        self.bytes += size
+        self.rows += len(data)
+        if self.limit is not None and self.bytes > self.limit:
+            self.spill()
+
+    @property
+    def spilled(self):
+        return len(self.spills) > 0
+
+    # Yield the rows of each local day, in order, reading spilled days back
+    def days(self):
+        memory = {}
+        frames = self.collect()
+        if frames:
+            df = pd.concat(frames, ignore_index=True, sort=False)
+            memory = dict(self.partition(df))
+            self.frames = []
+            self.bytes = 0
+
+        for day in sorted(set(memory.keys()) | set(self.spills.keys())):
+            parts = [pd.read_pickle(p) for p in self.spills.get(day, [])]
+            if day in memory:
+                parts.append(memory.pop(day))
+            yield pd.concat(parts, ignore_index=True, sort=False)
+
+    # Write the buffered rows to disk, one file per local day
+    def spill(self):
+        frames = self.collect()
+        if not frames:
+            return
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix=SPILL_PREFIX, dir=SPILL_DIR)
+
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        for day, part in self.partition(df):
+            path = os.path.join(self.spill_dir, '{D}-{N}.pkl'.format(D=day,
+                N=len(self.spills.get(day, []))))
+            part.to_pickle(path)
+            self.spills.setdefault(day, []).append(path)
+
+        logger.debug('Spilled {N} rows ({MB} MB) to {D}'.format(N=len(df),
+            MB=round(self.bytes / 2.0 ** 20, 1), D=self.spill_dir))
+        self.frames = []
+        self.bytes = 0
+
+    # Split rows by the local day of their timestamp
+    def partition(self, df):
+        dates = pd.Series(pd.DatetimeIndex(df[self.date_column]).strftime('%Y-%m-%d'),
+            index=df.index).fillna(NAT_PARTITION)
+        for day, part in df.groupby(dates.values, sort=True):
+            yield day, part
+
+    def close(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+        self.spills = {}
+        super(SpillBuffer, self).close()
+
+# Concatenate the daily aggregates of separate days as if they had been
+# aggregated together: columns missing on some days (ex. an event that did
+# not happen) are zero, keep their place and keep integer types
+def concat_days(frames):
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    df = df[merge_columns(frames)]
+
+    for column in df.columns:
+        if not df[column].isnull().any():
+            continue
+        kinds = set(f[column].dtype.kind for f in frames if column in f.columns)
+        if not kinds <= set('iufb'):
+            continue
+        df[column] = df[column].fillna(0)
+        if 'i' in kinds and (df[column] % 1 == 0).all():
+            df[column] = df[column].astype(int)
+    return df
+
+# Union of the columns of each frame, in an order consistent with all of them
+def merge_columns(frames):
+    columns = []
+    for frame in frames:
+        frame_columns = list(frame.columns)
+        for i, column in enumerate(frame_columns):
+            if column in columns:
+                continue
+            following = [c for c in frame_columns[i + 1:] if c in columns]
+            if following:
+                columns.insert(columns.index(following[0]), column)
+            else:
+                columns.append(column)
+    return columns
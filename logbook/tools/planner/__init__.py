@@ -0,0 +1,227 @@
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+
+import logbook
+from logbook import tools
+from logbook import phone
+from logbook.tools import beiwe
+from logbook.tools import inventory
+from logbook.tools import scheduler
+from logbook.tools import writers
+
+logger = logging.getLogger(__name__)
+
+PLAN_FIELDS = ['job', 'study', 'subject', 'data_type', 'stream', 'files', 'mb',
+    'first_day', 'last_day', 'days', 'action', 'output', 'estimated_seconds']
+
+# Throughput assumed for streams missing from the throughput report
+DEFAULT_BYTES_PER_SECOND = 2 * 2 ** 20
+DEFAULT_SECONDS_PER_FILE = 0.02
+
+# Stages that read raw files
+READ_STAGES = ['read_csv', 'read_dicom']
+# Stages that read, parse and accumulate each file, counted once per file.
+# The others run inside them (ex. partial_seconds in accumulate), or once per
+# stream after every file is read
+FILE_STAGES = READ_STAGES + ['read_cache', 'parse', 'accumulate']
+
+# Plan every job from the directory scan alone, without opening any file
+def plan(jobs, throughput=None):
+    throughput = throughput if throughput is not None else {}
+    rows = []
+    for job in jobs:
+        try:
+            rows.extend(plan_job(job, throughput))
+        except Exception as e:
+            logger.error(e)
+            logger.error('Could not plan {J}'.format(J=job.name))
+    return rows
+
+# One plan row per stream of a phone job, or per data type otherwise
+def plan_job(job, throughput):
+    read_dir = os.path.expanduser(job.read_dir)
+    if not tools.is_dir(read_dir):
+        return []
+    date_from = logbook.get_date_from(job.date_from, job.output_tz)
+    if date_from is None:
+        return []
+    # Output file names end with the extension of the job's format
+    writers.set_format(job.output_format)
+
+    manifest = None
+    if job.incremental:
+        manifest = logbook.get_manifest(job, read_dir,
+            os.path.expanduser(job.output_dir), date_from)
+
+    if job.data_type != 'phone':
+        mod = logbook.get_mod(job.data_type)
+        if mod is None:
+            return []
+        entries = list(inventory.list_files(read_dir))
+        unchanged = manifest is not None and manifest.unchanged(job.data_type, [read_dir])
+        return [plan_row(job, job.data_type, '', entries, mod, date_from, unchanged,
+            throughput)]
+
+    rows = []
+    streams = job.phone_streams if job.phone_streams else scheduler.get_streams(read_dir)
+    for stream in streams:
+        mod = phone.import_mod(stream)
+        if mod is None:
+            continue
+        stream_dirs = [os.path.join(read_dir, beiwe_id, stream)
+            for beiwe_id in tools.scan_dir(read_dir)]
+        stream_dirs = [d for d in stream_dirs if tools.is_dir(d)]
+        entries = [entry for d in stream_dirs for entry in inventory.list_files(d)
+            if beiwe.verify(mod, entry.name)[0] is not None]
+        # Files outside of the requested days are not read, unless none is
+        # left (see logbook.phone.process)
+        if job.day_from is not None or job.day_to is not None:
+            window = beiwe.DayWindow(date_from, job.day_from, job.day_to,
+                job.output_tz, job.input_tz)
+            entries = [entry for entry in entries if window.keep(entry.name)] or entries
+        unchanged = manifest is not None and manifest.unchanged(stream, stream_dirs)
+        rows.append(plan_row(job, 'phone', stream, entries, mod, date_from, unchanged,
+            throughput))
+    return rows
+
+def plan_row(job, data_type, stream, entries, mod, date_from, unchanged, throughput):
+    category = stream if stream else '*'
+    regex = beiwe.FILE_REGEX if data_type == 'phone' else None
+    days = file_days(entries, regex, date_from, job.input_tz, job.output_tz)
+    size = sum(entry.size for entry in entries)
+
+    if unchanged:
+        action = 'skip'
+    elif not entries:
+        action = 'no data'
+    else:
+        action = 'write'
+        existing = tools.scan_files(os.path.expanduser(job.output_dir))
+        prefix = '{ST}-{SB}-{DATA}_'.format(ST=job.study, SB=job.subject,
+            DATA=tools.camel_case(data_type))
+        if stream:
+            prefix += '{C}_'.format(C=tools.camel_case(stream))
+        if any(f.startswith(prefix) for f in existing):
+            action = 'rewrite'
+
+    output = ''
+    if entries:
+        # Exports start at day 1, or earlier when there is data before it
+        day_from = job.day_from if job.day_from is not None else min(days + [1])
+        day_to = job.day_to if job.day_to is not None else (max(days) if days else '*')
+        output = tools.get_filename_daily(job.study, job.subject,
+            tools.camel_case(data_type), tools.camel_case(category), day_from, day_to)
+
+    return {
+        'job': job.name,
+        'study': job.study,
+        'subject': job.subject,
+        'data_type': data_type,
+        'stream': stream,
+        'files': len(entries),
+        'mb': round(size / 2.0 ** 20, 3),
+        'first_day': min(days) if days else '',
+        'last_day': max(days) if days else '',
+        'days': len(days),
+        'action': action,
+        'output': output,
+        'estimated_seconds': 0.0 if action in ['skip', 'no data'] else
+            estimate_seconds(throughput, data_type, stream, len(entries), size)
+    }
+
+# Days covered by files named after their hour (ex. Beiwe files), counted
+# from the day 1 date in the output time zone
+def file_days(entries, regex, date_from, input_tz, output_tz):
+    if regex is None:
+        return []
+
+    input_tz = logbook.get_tz(input_tz)
+    output_tz = logbook.get_tz(output_tz)
+    days = set()
+    for entry in entries:
+        match = regex.match(entry.name)
+        if match is None:
+            continue
+        fields = match.groupdict()
+        try:
+            timestamp = datetime(int(fields['year']), int(fields['month']),
+                int(fields['day']), int(fields.get('hour') or 0),
+                int(fields.get('minute') or 0), int(fields.get('second') or 0),
+                tzinfo=input_tz).astimezone(output_tz)
+        except (KeyError, ValueError):
+            continue
+        days.add(tools.process_date(timestamp, date_from))
+    return sorted(days)
+
+# Seconds a stream should take at the throughput of a previous run
+def estimate_seconds(throughput, data_type, stream, files, size):
+    rate = throughput.get((data_type, stream), throughput.get('all', {}))
+    if size > 0:
+        return round(size / float(rate.get('bytes_per_second',
+            DEFAULT_BYTES_PER_SECOND)), 1)
+    return round(files * rate.get('seconds_per_file', DEFAULT_SECONDS_PER_FILE), 1)
+
+# Bytes per second and seconds per file of each data type and stream in a
+# run report written with --report
+def load_throughput(path):
+    try:
+        with open(path, 'r') as f:
+            if path.endswith('.csv'):
+                stages = list(csv.DictReader(f))
+            else:
+                stages = json.load(f).get('stages', [])
+    except Exception as e:
+        logger.error(e)
+        logger.error('Could not read throughput report %s' % path)
+        return {}
+
+    totals = {}
+    for stage in stages:
+        if stage['stage'] not in FILE_STAGES:
+            continue
+        key = (stage['data_type'], stage.get('stream') or '')
+        for k in [key, 'all']:
+            total = totals.setdefault(k, {'seconds': 0.0, 'bytes': 0, 'files': 0})
+            total['seconds'] += float(stage['seconds'])
+            if stage['stage'] != 'accumulate':
+                total['files'] += int(stage['files'])
+            if stage['stage'] in READ_STAGES:
+                total['bytes'] += int(stage['bytes'])
+
+    throughput = {}
+    for key, total in totals.items():
+        rate = {}
+        if total['bytes'] > 0 and total['seconds'] > 0:
+            rate['bytes_per_second'] = total['bytes'] / total['seconds']
+        if total['files'] > 0:
+            rate['seconds_per_file'] = total['seconds'] / total['files']
+        throughput[key] = rate
+    return throughput
+
+# Time to run the planned jobs on a number of workers, largest first
+def makespan(rows, workers):
+    loads = [0.0] * max(1, workers)
+    for seconds in sorted((r['estimated_seconds'] for r in rows), reverse=True):
+        loads[loads.index(min(loads))] += seconds
+    return max(loads)
+
+# Print the plan as a table followed by totals
+def print_plan(rows, workers=1):
+    widths = dict((f, max([len(f)] + [len(str(r[f])) for r in rows]))
+        for f in PLAN_FIELDS if f != 'job')
+    fields = [f for f in PLAN_FIELDS if f != 'job']
+    print('  '.join(f.ljust(widths[f]) for f in fields))
+    for row in rows:
+        print('  '.join(str(row[f]).ljust(widths[f]) for f in fields))
+
+    todo = [r for r in rows if r['action'] in ['write', 'rewrite']]
+    print('')
+    print('{N} of {T} streams to process: {F} files, {MB} MB, {S}s of work, '
+        'about {M}s on {W} workers'.format(N=len(todo), T=len(rows),
+            F=sum(r['files'] for r in todo),
+            MB=round(sum(r['mb'] for r in todo), 1),
+            S=round(sum(r['estimated_seconds'] for r in todo), 1),
+            M=round(makespan(todo, workers), 1), W=workers))
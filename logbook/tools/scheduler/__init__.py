@@ -0,0 +1,126 @@
+import os
+import copy
+import logging
+
+from logbook import tools
+from logbook.tools import inventory
+
+logger = logging.getLogger(__name__)
+
+# Gzipped files hold several times their size in rows
+GZIP_RATIO = 4
+# Fixed cost of opening and parsing a file, in bytes
+FILE_COST = 64 * 1024
+# Streams that logbook.phone skips
+SKIPPED_STREAMS = ['identifiers', 'reachability']
+# Number of jobs listed in the predicted vs actual cost report
+REPORT_JOBS = 10
+
+# Split phone jobs per stream, estimate every job's cost and order them most
+# expensive first
+def schedule(jobs, split_streams=True):
+    scheduled = []
+    for job in jobs:
+        if split_streams and job.data_type == 'phone':
+            scheduled.extend(split_phone_job(job))
+        else:
+            scheduled.append(job)
+
+    for job in scheduled:
+        job.cost = estimate_cost(job)
+
+    scheduled.sort(key=lambda job: job.cost, reverse=True)
+    logger.info('Scheduled {N} jobs, {MB} MB of raw data'.format(N=len(scheduled),
+        MB=round(sum(job.cost for job in scheduled) / 2.0 ** 20, 1)))
+    return scheduled
+
+# One job per phone stream found under any of the Beiwe IDs
+def split_phone_job(job):
+    streams = job.phone_streams if job.phone_streams else get_streams(job.read_dir)
+    if len(streams) < 2:
+        return [job]
+
+    jobs = []
+    for stream in streams:
+        stream_job = copy.copy(job)
+        stream_job.phone_streams = [stream]
+        stream_job.name = '/'.join([job.name, stream])
+        jobs.append(stream_job)
+    return jobs
+
+def get_streams(read_dir):
+    streams = set()
+    for beiwe_id in tools.scan_dir(read_dir):
+        if beiwe_id[0] == '.':
+            continue
+        for stream in tools.scan_dir(os.path.join(read_dir, beiwe_id)):
+            if stream[0] != '.' and stream not in SKIPPED_STREAMS:
+                streams.add(stream)
+    return sorted(streams)
+
+# Estimated cost of a job from the sizes of its raw files
+def estimate_cost(job):
+    read_dir = os.path.expanduser(job.read_dir)
+    if not tools.is_dir(read_dir):
+        return 0
+
+    if job.data_type == 'phone' and job.phone_streams:
+        read_dirs = [os.path.join(read_dir, beiwe_id, stream)
+            for beiwe_id in tools.scan_dir(read_dir)
+            for stream in job.phone_streams]
+    else:
+        read_dirs = [read_dir]
+
+    cost = 0
+    for path in read_dirs:
+        if not tools.is_dir(path):
+            continue
+        for entry in inventory.list_files(path):
+            cost += file_cost(entry)
+    return cost
+
+def file_cost(entry):
+    if entry.name.endswith('.gz'):
+        return entry.size * GZIP_RATIO + FILE_COST
+    return entry.size + FILE_COST
+
+# Compare the estimated costs with the time each job took
+def report_costs(results):
+    timed = [r for r in results if r.get('cost') and r['status'] == 'ok']
+    total_cost = sum(r['cost'] for r in timed)
+    total_elapsed = sum(r['elapsed'] for r in timed)
+    if not timed or total_cost == 0 or total_elapsed == 0:
+        return
+
+    # Seconds per byte of estimated cost, over the whole run
+    rate = total_elapsed / float(total_cost)
+    for r in results:
+        if r.get('cost') is not None:
+            r['predicted'] = round(r['cost'] * rate, 3)
+
+    logger.info('Cost model: {R} s/MB, rank correlation of predicted and actual '
+        'time {C}'.format(R=round(rate * 2 ** 20, 3),
+            C=round(rank_correlation([r['predicted'] for r in timed],
+                [r['elapsed'] for r in timed]), 3)))
+
+    timed.sort(key=lambda r: abs(r['elapsed'] - r['predicted']), reverse=True)
+    for r in timed[:REPORT_JOBS]:
+        logger.info('Job {J}: predicted {P}s, took {T}s'.format(J=r['job'],
+            P=r['predicted'], T=r['elapsed']))
+
+# Spearman's rank correlation, without ties correction
+def rank_correlation(x, y):
+    n = len(x)
+    if n < 2:
+        return 1.0
+    rank_x = ranks(x)
+    rank_y = ranks(y)
+    d = sum((rank_x[i] - rank_y[i]) ** 2 for i in range(n))
+    return 1 - 6.0 * d / (n * (n ** 2 - 1))
+
+def ranks(values):
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    result = [0] * len(values)
+    for rank, i in enumerate(order):
+        result[i] = rank
+    return result
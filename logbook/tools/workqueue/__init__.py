@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import errno
+import socket
+import logging
+import threading
+import multiprocessing as mp
+
+import logbook
+from logbook import tools
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+STATES = [PENDING, CLAIMED, DONE, FAILED]
+
+# Seconds between heartbeats of a claimed job
+HEARTBEAT = 30
+# Seconds without a heartbeat after which a claimed job is released
+LEASE = 600
+# Seconds between looks at the queue while other workers hold the last jobs
+POLL = 15
+# Number of times a job is released after its worker died before it fails
+MAX_ATTEMPTS = 3
+# Seconds between looks at the worker processes of a node
+WATCH = 1
+
+# Job queue kept in a directory on a filesystem shared by every node. Each job
+# is a JSON file that moves between the state directories with atomic renames,
+# so no broker or lock server is needed
+class WorkQueue(object):
+    def __init__(self, path, lease=LEASE, heartbeat=HEARTBEAT, poll=POLL,
+            max_attempts=MAX_ATTEMPTS):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.lease = lease
+        # Several heartbeats fit in a lease, so a slow write does not lose it
+        self.heartbeat = min(heartbeat, lease / 4.0)
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self.worker = worker_name(os.getpid())
+        for state in STATES:
+            tools.make_dirs(self.state_dir(state))
+
+    def state_dir(self, state):
+        return os.path.join(self.path, state)
+
+    # Write a descriptor for each job, keeping their order. Jobs already
+    # pending or claimed are not added twice
+    def enqueue(self, jobs):
+        queued = set(descriptor_job(f) for state in [PENDING, CLAIMED]
+            for f in os.listdir(self.state_dir(state)))
+        batch = time.strftime('%Y%m%d%H%M%S')
+
+        count = 0
+        for seq, job in enumerate(jobs):
+            job_id = safe_name(job.name)
+            if job_id in queued:
+                logger.warn('Job {J} is already queued. Skipping'.format(J=job.name))
+                continue
+            file_name = '{B}-{S:06d}-{J}.json'.format(B=batch, S=seq, J=job_id)
+            self.write(os.path.join(self.state_dir(PENDING), file_name),
+                {'job': job_to_dict(job), 'attempts': 0})
+            count += 1
+
+        logger.info('Queued {N} jobs in {Q}'.format(N=count, Q=self.path))
+        return count
+
+    # Move the next pending job to claimed. Returns the claimed path and
+    # descriptor, or None when another worker took every pending job first
+    def claim(self):
+        for file_name in sorted(os.listdir(self.state_dir(PENDING))):
+            if not file_name.endswith('.json'):
+                continue
+            claimed = os.path.join(self.state_dir(CLAIMED), file_name)
+            try:
+                os.rename(os.path.join(self.state_dir(PENDING), file_name), claimed)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    continue
+                raise
+            os.utime(claimed, None)
+            descriptor = self.read(claimed)
+            if descriptor is None:
+                os.rename(claimed, os.path.join(self.state_dir(FAILED), file_name))
+                continue
+            # The claimant is kept if the job fails after its lease expires
+            descriptor['worker'] = self.worker
+            self.write(claimed, descriptor)
+            logger.info('Claimed {J}'.format(J=descriptor['job']['name']))
+            return claimed, descriptor
+        return None
+
+    # Release claimed jobs whose worker stopped sending heartbeats
+    def release_expired(self):
+        now = self.now()
+        for file_name in sorted(os.listdir(self.state_dir(CLAIMED))):
+            if not file_name.endswith('.json'):
+                continue
+            claimed = os.path.join(self.state_dir(CLAIMED), file_name)
+            try:
+                if now - os.path.getmtime(claimed) < self.lease:
+                    continue
+                # Only one worker wins the rename and requeues the job
+                expired = '{P}.expired.{W}'.format(P=claimed, W=self.worker)
+                os.rename(claimed, expired)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    continue
+                raise
+
+            descriptor = self.read(expired)
+            if descriptor is None:
+                os.remove(expired)
+                continue
+            descriptor['attempts'] = descriptor.get('attempts', 0) + 1
+            name = descriptor['job']['name']
+            if descriptor['attempts'] >= self.max_attempts:
+                logger.error('Job {J} lost its worker {N} times. Giving up'.format(J=name,
+                    N=descriptor['attempts']))
+                descriptor['result'] = {'job': name, 'status': 'failed',
+                    'error': 'lease expired', 'elapsed': 0.0, 'stages': []}
+                self.write(os.path.join(self.state_dir(FAILED), file_name), descriptor)
+            else:
+                logger.warn('Lease of {J} expired. Releasing it'.format(J=name))
+                self.write(os.path.join(self.state_dir(PENDING), file_name), descriptor)
+            os.remove(expired)
+
+    # Record the result of a claimed job and remove its claim
+    def finish(self, claimed, descriptor, state):
+        self.write(os.path.join(self.state_dir(state),
+            os.path.basename(claimed)), descriptor)
+        try:
+            os.remove(claimed)
+        except OSError as e:
+            logger.warn('Lost the claim of {P}: {E}'.format(P=claimed, E=e))
+
+    # Number of jobs in each state
+    def status(self):
+        return dict((state, len([f for f in os.listdir(self.state_dir(state))
+            if f.endswith('.json')])) for state in STATES)
+
+    # Whether no job is left to claim or running
+    def drained(self):
+        status = self.status()
+        return status[PENDING] == 0 and status[CLAIMED] == 0
+
+    # Results of the jobs the given workers finished since a time on the
+    # shared filesystem (see now)
+    def results(self, workers, since=0):
+        results = []
+        for state in [DONE, FAILED]:
+            for file_name in sorted(os.listdir(self.state_dir(state))):
+                path = os.path.join(self.state_dir(state), file_name)
+                if not file_name.endswith('.json') or os.path.getmtime(path) < since:
+                    continue
+                descriptor = self.read(path)
+                if descriptor is not None and descriptor.get('worker') in workers:
+                    results.append(descriptor['result'])
+        return results
+
+    # Current time on the shared filesystem, so that nodes with skewed clocks
+    # agree on lease expiry
+    def now(self):
+        clock = os.path.join(self.path, '.clock.{W}'.format(W=self.worker))
+        with open(clock, 'w'):
+            pass
+        now = os.path.getmtime(clock)
+        os.remove(clock)
+        return now
+
+    # Write a file next to its destination and rename it into place
+    def write(self, path, descriptor):
+        temp_path = os.path.join(self.path, '.{N}.{W}.tmp'.format(
+            N=os.path.basename(path), W=self.worker))
+        with open(temp_path, 'w') as f:
+            json.dump(descriptor, f, sort_keys=True)
+        os.rename(temp_path, path)
+
+    def read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(e)
+            logger.error('Could not read job descriptor %s' % path)
+            return None
+
+# Refresh the modification time of a claimed job until stopped
+class Heartbeat(threading.Thread):
+    def __init__(self, path, interval):
+        super(Heartbeat, self).__init__()
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.path, None)
+            except OSError as e:
+                logger.warn('Could not refresh the lease of {P}: {E}'.format(P=self.path,
+                    E=e))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+# Claim and run jobs until the queue is drained, in one or more processes.
+# A worker process that dies (ex. killed for lack of memory) is replaced
+# while jobs are left, and the job it held is released when its lease
+# expires. Results are read back from the queue
+def run_worker(queue_dir, processes=1, **kwargs):
+    if processes is None or processes < 2:
+        return work(queue_dir, kwargs)
+
+    queue = WorkQueue(queue_dir, **kwargs)
+    start = queue.now()
+    workers = [start_worker(queue_dir, kwargs) for _ in range(processes)]
+    finished = set()
+    restarts = 0
+    try:
+        while workers:
+            workers[0].join(WATCH)
+            for worker in [w for w in workers if not w.is_alive()]:
+                workers.remove(worker)
+                finished.add(worker_name(worker.pid))
+                if worker.exitcode == 0 or queue.drained():
+                    continue
+                if restarts >= processes * queue.max_attempts:
+                    logger.error('Worker process {P} exited with {C}. Not replacing it '
+                        'after {N} restarts'.format(P=worker.pid, C=worker.exitcode, N=restarts))
+                    continue
+                logger.error('Worker process {P} exited with {C}. Replacing it'.format(
+                    P=worker.pid, C=worker.exitcode))
+                workers.append(start_worker(queue_dir, kwargs))
+                restarts += 1
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        raise
+    finally:
+        for worker in workers:
+            worker.join()
+
+    return queue.results(finished, start)
+
+def start_worker(queue_dir, kwargs):
+    worker = mp.Process(target=work, args=(queue_dir, kwargs))
+    worker.start()
+    return worker
+
+# Name of a worker process in the descriptors of its jobs
+def worker_name(pid):
+    return '{H}.{PID}'.format(H=socket.gethostname(), PID=pid)
+
+# Worker loop of a single process
+def work(queue_dir, kwargs):
+    queue = WorkQueue(queue_dir, **kwargs)
+    results = []
+    while True:
+        queue.release_expired()
+        claim = queue.claim()
+        if claim is None:
+            status = queue.status()
+            if status[PENDING] == 0 and status[CLAIMED] == 0:
+                break
+            # Wait for the last jobs in case their workers die
+            time.sleep(queue.poll)
+            continue
+
+        claimed, descriptor = claim
+        heartbeat = Heartbeat(claimed, queue.heartbeat)
+        heartbeat.start()
+        try:
+            result = logbook.run_job(job_from_dict(descriptor['job']))
+        finally:
+            heartbeat.stop()
+
+        descriptor['result'] = result
+        descriptor['worker'] = queue.worker
+        queue.finish(claimed, descriptor,
+            FAILED if result['status'] == 'failed' else DONE)
+        results.append(result)
+
+    logger.info('Queue {Q} is drained, ran {N} jobs'.format(Q=queue.path,
+        N=len(results)))
+    return results
+
+def job_to_dict(job):
+    return dict(vars(job))
+
+def job_from_dict(d):
+    return logbook.Job(**d)
+
+# Job name part of a descriptor file name (<batch>-<seq>-<job>.json)
+def descriptor_job(file_name):
+    parts = file_name.split('-', 2)
+    if len(parts) < 3 or not file_name.endswith('.json'):
+        return None
+    return parts[2][:-len('.json')]
+
+def safe_name(name):
+    return name.replace(os.sep, '-').replace(' ', '_')
+
@@ -0,0 +1,181 @@
+import os
+import gzip
+import hashlib
+import logging
+from importlib import import_module
+import pandas as pd
+
+from logbook.tools import instrument
+
+logger = logging.getLogger(__name__)
+
+# Output formats and the extension of their files
+CSV = 'csv'
+FORMATS = {
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+    'csv.zst': '.csv.zst',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+TEXT_FORMATS = ['csv', 'csv.gz', 'csv.zst']
+# Packages an output format needs beyond pandas (any one of them)
+REQUIRES = {
+    'csv.zst': ['zstandard'],
+    'parquet': ['pyarrow', 'fastparquet'],
+    'feather': ['pyarrow'],
+}
+
+# Output format of the jobs running in this process
+FORMAT = CSV
+
+# Set the output format of the following jobs in this process
+def set_format(output_format=None):
+    global FORMAT
+    output_format = output_format if output_format else CSV
+    check_format(output_format)
+    FORMAT = output_format
+
+# Raise a ValueError if an output format is unknown or its packages are
+# missing, so a run fails before any work unit starts
+def check_format(output_format):
+    if output_format not in FORMATS:
+        raise ValueError('Unknown output format {F}'.format(F=output_format))
+    packages = REQUIRES.get(output_format)
+    if packages and not any(importable(p) for p in packages):
+        raise ValueError('Output format {F} needs the {P} package'.format(
+            F=output_format, P=' or '.join(packages)))
+
+def importable(package):
+    try:
+        import_module(package)
+        return True
+    except ImportError:
+        return False
+
+# File extension of the output format
+def extension():
+    return FORMATS[FORMAT]
+
+# Whether the output format is text (csv), or typed columns
+def text():
+    return FORMAT in TEXT_FORMATS
+
+# Write a table with the given columns in their order, in the output format.
+# Columns missing from the table are written empty, as are blank cells. The
+# table is written to a temporary file next to the output, which replaces it
+# in one rename, so readers never see a partial file. An output with the same
+# content is left untouched (with its modification time). Returns True if
+# the output was written
+def write(data, file_path, columns):
+    temp_path = get_temp_path(file_path)
+    try:
+        WRITERS[FORMAT](data, temp_path, columns)
+        size = os.path.getsize(temp_path)
+        if same_content(temp_path, file_path):
+            os.remove(temp_path)
+            logger.info('Unchanged %s' % file_path)
+            instrument.record('output_unchanged', bytes=size, files=1)
+            return False
+        replace(temp_path, file_path)
+        instrument.record('output_written', bytes=size, files=1)
+        return True
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# Hidden temporary file in the directory of an output, unique to the process
+def get_temp_path(file_path):
+    directory, file_name = os.path.split(file_path)
+    return os.path.join(directory, '.{N}.{P}.tmp'.format(N=file_name, P=os.getpid()))
+
+# Rename a file over another one, atomically on POSIX (os.replace is not
+# available on Python 2)
+replace = getattr(os, 'replace', os.rename)
+
+# Check if two files have the same size and content hash
+def same_content(path, other_path):
+    if not os.path.isfile(other_path):
+        return False
+    if os.path.getsize(path) != os.path.getsize(other_path):
+        return False
+    return file_hash(path) == file_hash(other_path)
+
+def file_hash(path, block_size=2 ** 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def write_csv(data, file_path, columns):
+    data.to_csv(path_or_buf=file_path,
+        index=False,
+        columns=columns,
+        na_rep='')
+
+# Gzipped csv. The header carries no time stamp, so the same table always
+# gives the same file
+def write_csv_gz(data, file_path, columns):
+    with open(file_path, 'wb') as f:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0) as gz:
+            gz.write(csv_bytes(data, columns))
+
+def write_csv_zst(data, file_path, columns):
+    zstandard = import_module('zstandard')
+    with open(file_path, 'wb') as f:
+        f.write(zstandard.ZstdCompressor().compress(csv_bytes(data, columns)))
+
+def csv_bytes(data, columns):
+    text = data.to_csv(index=False, columns=columns, na_rep='')
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+def write_parquet(data, file_path, columns):
+    columnar(data, columns).to_parquet(file_path, index=False)
+
+def write_feather(data, file_path, columns):
+    columnar(data, columns).to_feather(file_path)
+
+# Values of object columns that cannot be written as one type
+MIXED = ['mixed', 'mixed-integer']
+LEADING_ZERO = r'^[+-]?0[0-9]'
+
+# The table as typed columns: the given ones in their order (missing ones
+# empty) on a default index. Text columns that only hold numbers formatted
+# by the data types (ex. counts) are written as numbers, and empty cells as
+# nulls. Columns that mix text and other values (ex. numbers) are written as
+# text, as they would be in a csv file
+def columnar(data, columns):
+    data = data.reindex(columns=columns).reset_index(drop=True)
+    for column in data.columns:
+        values = data[column]
+        if values.dtype != object:
+            continue
+        numbers = numeric(values)
+        if numbers is not None:
+            data[column] = numbers
+        elif pd.api.types.infer_dtype(values, skipna=True) in MIXED:
+            data[column] = values.where(values.isna(), values.astype(str))
+    return data
+
+# Numbers of a text column whose values are all numbers, or None. Values
+# with leading zeros (ex. ids, UTC offsets) keep the column as text
+def numeric(values):
+    present = values.notna()
+    if not present.any():
+        return None
+    numbers = pd.to_numeric(values, errors='coerce')
+    if numbers[present].isna().any():
+        return None
+    if values[present].astype(str).str.match(LEADING_ZERO).any():
+        return None
+    return numbers
+
+WRITERS = {
+    'csv': write_csv,
+    'csv.gz': write_csv_gz,
+    'csv.zst': write_csv_zst,
+    'parquet': write_parquet,
+    'feather': write_feather,
+}
@@ -4,9 +4,17 @@ import sys
 import pandas as pd
 import logging
 import argparse as ap
-from importlib import import_module
 from datetime import datetime
+import logbook
 from logbook import tools
+from logbook.tools import aggregate
+from logbook.tools import cache
+from logbook.tools import instrument
+from logbook.tools import inventory
+from logbook.tools import planner
+from logbook.tools import scheduler
+from logbook.tools import workqueue
+from logbook.tools import writers
 
 logger = logging.getLogger(os.path.basename(__file__))
 
@@ -50,18 +58,162 @@ def main():
     argparser.add_argument('--day-to',
         help='Output day to. (optional; By default, process data for all days)',
         type=int)
+    argparser.add_argument('--jobs',
+        help='Number of work units to process in parallel. (Default: 1)',
+        type=int, default=1)
+    argparser.add_argument('--schedule',
+        help='Order of the work units: largest-first splits phone into one unit per '
+            'stream and starts the largest raw data first, listing keeps the directory order. '
+            '(Default: largest-first)',
+        choices=['largest-first', 'listing'], default='largest-first')
+    argparser.add_argument('--incremental',
+        help='Skip streams whose raw files and parameters did not change since the last run',
+        action='store_true')
+    argparser.add_argument('--manifest-dir',
+        help='Directory for the incremental run manifests. (Default: OUTPUT_DIR/.logbook)')
+    argparser.add_argument('--hash-inputs',
+        help='Compare raw file contents instead of modification times in incremental runs',
+        action='store_true')
+    argparser.add_argument('--report',
+        help='Write per-stage timings and throughput of the run to this file (.json or .csv)')
+    argparser.add_argument('--profile-job',
+        help='Profile the matching work units with cProfile (ex. "STUDY/SUBJECT/PROTECTED/phone")',
+        nargs='+')
+    argparser.add_argument('--profile-dir',
+        help='Directory where cProfile dumps are written. (Default: LOG_DIR)')
+    argparser.add_argument('--scan-threads',
+        help='Number of threads used to index the PHOENIX directory. (Default: 1)',
+        type=int, default=1)
+
+    argparser.add_argument('--memory-budget',
+        help='Memory budget in MB of each work unit. Chunk sizes follow it and parsed rows '
+            'are spilled to disk near it. (optional)',
+        type=int)
+    argparser.add_argument('--spill-dir',
+        help='Directory for rows spilled under --memory-budget. (Default: system temporary directory)')
+    argparser.add_argument('--read-threads',
+        help='Number of threads decompressing and parsing the raw phone files of each work unit. '
+            '(Default: 1)',
+        type=int, default=1)
+    argparser.add_argument('--cache-dir',
+        help='Cache the parsed rows of raw phone files in this directory, so unchanged files '
+            'are not parsed again. (optional)')
+    argparser.add_argument('--cache-max-size',
+        help='Size in MB beyond which the least recently used cache entries are evicted. (optional)',
+        type=int)
+    argparser.add_argument('--cache-max-age',
+        help='Age in days beyond which cache entries are evicted. (optional)',
+        type=int)
+    argparser.add_argument('--hll-precision',
+        help='Count distinct wifi and bluetooth MACs with HyperLogLog sketches of 2^P registers '
+            'instead of exactly (relative error about 1.04/sqrt(2^P)). (optional)',
+        type=int, metavar='P')
+    argparser.add_argument('--output-format',
+        help='Format of the output files: csv, csv.gz, csv.zst (needs zstandard), parquet '
+            '(needs pyarrow or fastparquet) or feather (needs pyarrow). (Default: csv)',
+        choices=sorted(writers.FORMATS), default=writers.CSV)
+
+    argparser.add_argument('--plan', action='store_true',
+        help='Print the raw files, days, outputs and estimated time of each work unit and exit')
+    argparser.add_argument('--throughput-report',
+        help='Run report (--report) whose throughput is used to estimate the time of --plan')
+
+    # Multi-node runs through a queue directory on a shared filesystem
+    argparser.add_argument('--queue-dir',
+        help='Shared directory holding the job queue of a multi-node run')
+    argparser.add_argument('--enqueue', action='store_true',
+        help='Write the work units to QUEUE_DIR instead of running them')
+    argparser.add_argument('--worker', action='store_true',
+        help='Run work units from QUEUE_DIR until it is drained, with --jobs processes')
+    argparser.add_argument('--lease',
+        help='Seconds without a heartbeat before a claimed work unit is released '
+            'to other workers. (Default: {L})'.format(L=workqueue.LEASE),
+        type=int, default=workqueue.LEASE)
 
     args = argparser.parse_args()
+    if (args.enqueue or args.worker) and not args.queue_dir:
+        argparser.error('--enqueue and --worker require --queue-dir')
+    try:
+        writers.check_format(args.output_format)
+        aggregate.check_precision(args.hll_precision)
+    except ValueError as e:
+        argparser.error(str(e))
 
     # Log file initialization
     log_date= datetime.today().strftime('%Y%m%d')
     DEFAULT_LOGFILE_LOCATION = os.path.join(str(args.log_dir),str(log_date)+'logbook.log')
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
+        format='%(asctime)s - %(process)d - %(job)s - %(levelname)s - %(message)s',
         filename=str(DEFAULT_LOGFILE_LOCATION))
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(logbook.JobFilter())
+
+    # Index the PHOENIX tree once, every module reads from the index
+    if args.phoenix_dir:
+        inventory.set_inventory(inventory.build_inventory(get_scan_roots(args),
+            args.scan_threads))
+
+    # Workers only need the queue
+    jobs = []
+    if not args.worker or args.enqueue:
+        jobs = list(get_jobs(args))
+        logger.info('Found {N} work units'.format(N=len(jobs)))
+        if args.schedule == 'largest-first':
+            jobs = scheduler.schedule(jobs)
+        set_profiles(jobs, args)
+
+    if args.plan:
+        throughput = planner.load_throughput(args.throughput_report) if args.throughput_report else None
+        planner.print_plan(planner.plan(jobs, throughput), args.jobs)
+        return
+
+    if args.queue_dir:
+        queue = workqueue.WorkQueue(args.queue_dir, lease=args.lease)
+        if args.enqueue:
+            queue.enqueue(jobs)
+        if not args.worker:
+            logger.info('Queue status: {S}'.format(S=queue.status()))
+            return
+        results = workqueue.run_worker(args.queue_dir, args.jobs, lease=args.lease)
+    else:
+        results = logbook.run_batch(jobs, args.jobs)
+    log_summary(results)
+    cache.set_cache(args.cache_dir, args.cache_max_size, args.cache_max_age)
+    cache.evict()
+    if args.schedule == 'largest-first':
+        scheduler.report_costs(results)
+
+    if args.report:
+        instrument.write_report(args.report, results)
+    return
 
+# Attach a cProfile dump path to the requested work units
+def set_profiles(jobs, args):
+    if not args.profile_job:
+        return
+
+    profile_dir = args.profile_dir if args.profile_dir else str(args.log_dir)
+    for job in jobs:
+        if any(job.name == p or job.name.startswith(p + '/') for p in args.profile_job):
+            file_name = job.name.replace('/', '-') + '.prof'
+            job.profile = os.path.join(profile_dir, file_name)
+
+# Directories to index, restricted to the requested studies
+def get_scan_roots(args):
+    if not args.study:
+        return [args.phoenix_dir]
+
+    roots = []
+    for directory in tools.scan_dir(args.phoenix_dir):
+        for study in args.study:
+            roots.append(os.path.join(args.phoenix_dir, directory, study))
+    return [root for root in roots if os.path.isdir(root)]
+
+# Build (study, subject, phoenix directory, data type) work units
+def get_jobs(args):
     # Gets all studies under each subdirectory
     studies = args.study if args.study else tools.scan_dir(args.consent_dir)
+    directories = tools.scan_dir(args.phoenix_dir)
 
     for study in studies:
         study_path = os.path.join(args.consent_dir, study)
@@ -78,11 +230,10 @@ def main():
             if not verified:
                 continue
 
-            logger.info('Processing {S} in {ST}'.format(S=subject, ST=study))
+            logger.info('Queueing {S} in {ST}'.format(S=subject, ST=study))
             date_from = consents[subject][0]
 
             # Loops through PHOENIX's subdirectories.
-            directories = tools.scan_dir(args.phoenix_dir)
             for directory in sorted(directories):
                 subject_path = os.path.join(args.phoenix_dir, directory, study, subject)
 
@@ -94,33 +245,61 @@ def main():
                         data_type,
                         'processed')
 
-                    mod = get_module()
-                    mod_parser = mod.parse_args()
-
-                    new_args, unknown = mod_parser.parse_known_args([
-                        '--date-from', str(date_from),
-                        '--read-dir', str(data_path),
-                        '--phone-stream', str(args.phone_stream),
-                        '--output-dir', str(output_path),
-                        '--day-from', str(args.day_from),
-                        '--day-to', str(args.day_to),
-                        '--input-tz', str(args.input_tz),
-                        '--output-tz', str(args.output_tz),
-                        '--study', str(study),
-                        '--subject', str(subject),
-                        '--data-type', str(data_type)
-                    ])
-                    mod.main(new_args)
-    return
+                    yield logbook.Job(study, subject, data_type,
+                        read_dir=data_path,
+                        output_dir=output_path,
+                        date_from=date_from,
+                        input_tz=args.input_tz,
+                        output_tz=args.output_tz,
+                        day_from=args.day_from,
+                        day_to=args.day_to,
+                        phone_streams=args.phone_stream,
+                        incremental=args.incremental,
+                        manifest_dir=args.manifest_dir,
+                        hash_inputs=args.hash_inputs,
+                        memory_budget=args.memory_budget,
+                        spill_dir=args.spill_dir,
+                        read_threads=args.read_threads,
+                        cache_dir=args.cache_dir,
+                        hll_precision=args.hll_precision,
+                        output_format=args.output_format,
+                        name='/'.join([study, subject, directory, data_type]))
 
-# Import module based on user input
-def get_module():
-    try:
-        return import_module('logbook', __name__)
-    except Exception as e:
-        logger.error(e)
-        logger.error('Could not import the pipeline module. Exiting')
-        sys.exit(1)
+# Log the per-job outcome of the run
+def log_summary(results):
+    failed = [r for r in results if r['status'] == 'failed']
+    elapsed = sum(r['elapsed'] for r in results)
+
+    logger.info('{N} work units finished, {F} failed, {T}s total job time'.format(
+        N=len(results), F=len(failed), T=round(elapsed, 3)))
+    for r in failed:
+        logger.error('Work unit {J} failed: {E}'.format(J=r['job'], E=r['error']))
+
+    peak = max([r.get('peak_rss_mb', 0) for r in results] + [0])
+    logger.info('Peak RSS of a work unit process: {M} MB'.format(M=peak))
+
+    read = [s for r in results for s in r.get('stages', []) if s['stage'] == 'read_csv']
+    read_bytes = sum(s['bytes'] for s in read)
+    read_seconds = sum(s['seconds'] for s in read)
+    if read_seconds > 0:
+        logger.info('Read {N} rows and {B} MB from {F} files at {R} MB/s'.format(
+            N=sum(s['rows'] for s in read),
+            B=round(read_bytes / 2.0 ** 20, 1),
+            F=sum(s['files'] for s in read),
+            R=round(read_bytes / 2.0 ** 20 / read_seconds, 2)))
+
+    cached = [s for r in results for s in r.get('stages', []) if s['stage'] == 'read_cache']
+    if cached:
+        logger.info('Read {N} rows of {F} files from the parse cache'.format(
+            N=sum(s['rows'] for s in cached),
+            F=sum(s['files'] for s in cached)))
+
+    stages = [s for r in results for s in r.get('stages', [])]
+    written = sum(s['files'] for s in stages if s['stage'] == 'output_written')
+    unchanged = sum(s['files'] for s in stages if s['stage'] == 'output_unchanged')
+    if written or unchanged:
+        logger.info('Wrote {W} output files, left {U} unchanged'.format(
+            W=written, U=unchanged))
 
 # Ensures data can be processed for the subject
 def verify_subject(subject, path, consents):
@@ -129,7 +308,7 @@ def verify_subject(subject, path, consents):
         logger.debug('Subject {S} is not a valid subject.'.format(S=subject))
         return False
 
-    if not os.path.isdir(path):
+    if not tools.is_dir(path):
         logger.debug('Path {P} does not exist.'.format(P=path))
         return False
 
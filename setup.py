@@ -10,6 +10,7 @@ requires = [
     'pydicom',
     'python-dateutil',
     'pytz',
+    'scandir; python_version < "3.5"',
     'six',
     'zope.interface'
 ]
@@ -17,6 +18,12 @@ requires = [
 test_requirements = [
 ]
 
+extras = {
+    'feather': ['pyarrow'],
+    'parquet': ['pyarrow'],
+    'zstd': ['zstandard'],
+}
+
 about = dict()
 with open(os.path.join(here, 'logbook', '__version__.py'), 'r') as f:
     exec(f.read(), about)
@@ -33,5 +40,6 @@ setup(
         'scripts/lb.py'
     ],
     install_requires=requires, 
+    extras_require=extras,
     tests_require=test_requirements
 )
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import logbook
+from logbook.tools import aggregate
+
+KEYS = ['day', 'second']
+
+def rows(n, seed=1):
+    rng = np.random.RandomState(seed)
+    values = rng.normal(100, 15, n)
+    values[rng.rand(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        'day': rng.randint(1, 4, n),
+        'second': rng.randint(0, 5, n),
+        'value': values,
+        'mac': rng.randint(0, 40, n).astype(str),
+    })
+
+# Uneven batches of the rows, as chunks and files split them
+def batches(df, sizes=(1, 7, 50, 300)):
+    bounds = np.cumsum((0,) + sizes)
+    return [df.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:])] + [df.iloc[bounds[-1]:]]
+
+def test_merged_summaries_match_a_single_pass():
+    df = rows(1000)
+    merged = aggregate.merge([aggregate.summarize(b, KEYS, 'value') for b in batches(df)])
+    single = aggregate.summarize(df, KEYS, 'value')
+    grouped = df.groupby(KEYS)['value']
+
+    pd.testing.assert_frame_equal(merged[['count', 'min', 'max']], single[['count', 'min', 'max']],
+        check_dtype=False)
+    np.testing.assert_allclose(merged['sum'], single['sum'])
+    np.testing.assert_allclose(merged['m2'], single['m2'])
+    np.testing.assert_allclose(aggregate.mean(merged), grouped.mean())
+    np.testing.assert_allclose(aggregate.variance(merged), grouped.var())
+
+def test_merged_distinct_values_match_a_single_pass():
+    df = rows(1000)
+    merged = aggregate.merge([aggregate.distinct(b, KEYS, 'mac') for b in batches(df)])
+    counts = aggregate.count_distinct(merged)
+    expected = df.groupby(KEYS)['mac'].nunique()
+    assert counts.to_dict() == expected.to_dict()
+
+def test_groups_without_values():
+    df = pd.DataFrame({
+        'day': [1, 1, 2, 2, 3],
+        'second': [0, 0, 0, 0, 0],
+        'value': [1.0, 3.0, np.nan, np.nan, 5.0],
+        'mac': ['a', 'b', None, None, 'a'],
+    })
+    merged = aggregate.merge([None, aggregate.summarize(df.iloc[:3], KEYS, 'value'), None,
+        aggregate.summarize(df.iloc[3:], KEYS, 'value')])
+
+    assert merged['count'].tolist() == [2, 0, 1]
+    assert aggregate.mean(merged).isnull().tolist() == [False, True, False]
+    assert aggregate.variance(merged).tolist()[0] == 2.0
+    assert aggregate.variance(merged).isnull().tolist()[1:] == [True, True]
+
+    index = aggregate.counts(df, KEYS).index
+    distinct = aggregate.merge([aggregate.distinct(df.iloc[:3], KEYS, 'mac'), None])
+    assert aggregate.count_distinct(distinct, index).tolist() == [2, 0, 0]
+    sketch = aggregate.sketch(df, KEYS, 'mac', 12)
+    assert aggregate.count_sketch(sketch, 12, index).tolist() == [2, 0, 1]
+
+@pytest.mark.parametrize('precision', [10, 12, 14])
+def test_sketch_estimate_is_within_its_error(precision):
+    n = 50000
+    df = pd.DataFrame({'day': 1, 'second': 0, 'mac': ['mac{N}'.format(N=i) for i in range(n)]})
+    parts = [aggregate.sketch(b, KEYS, 'mac', precision) for b in batches(df, (10, 5000, 20000))]
+    merged = aggregate.merge(parts)
+
+    pd.testing.assert_frame_equal(merged, aggregate.sketch(df, KEYS, 'mac', precision))
+    error = 1.04 / np.sqrt(2 ** precision)
+    estimate = aggregate.count_sketch(merged, precision).iloc[0]
+    assert abs(estimate - n) < 4 * error * n
+
+# Linear counting has a standard error of sqrt(m * (e^t - t - 1)) for n
+# values in m registers, with t = n / m (Whang et al., 1990)
+def test_sketch_counts_small_groups_by_linear_counting():
+    m = 2 ** 12
+    for n in [1, 10, 100, 1000, 5000]:
+        df = pd.DataFrame({'day': 1, 'second': 0, 'mac': [str(i) for i in range(n)] * 2})
+        estimate = aggregate.count_sketch(aggregate.sketch(df, KEYS, 'mac', 12), 12).iloc[0]
+        t = n / float(m)
+        assert abs(estimate - n) <= max(1, 4 * np.sqrt(m * (np.exp(t) - t - 1)))
+
+def test_precision_out_of_range_fails_the_job():
+    with pytest.raises(ValueError):
+        aggregate.check_precision(aggregate.MAX_PRECISION + 1)
+    job = logbook.Job('STUDY', 'S01', 'phone', '/read', '/output', '2019-03-08',
+        hll_precision=40)
+    result = logbook.run_job(job)
+    assert result['status'] == 'failed'
+    assert 'precision' in result['error']
+    aggregate.set_precision()
@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from logbook.phone import accelerometer
+from logbook.phone import texts
+from logbook.tools import beiwe
+
+def read(mod, tmpdir, lines):
+    path = tmpdir.join('2019-03-08 10_00_00.csv')
+    path.write('\n'.join(lines) + '\n')
+    chunks = list(beiwe.read_csv(mod, str(path), '.csv'))
+    return pd.concat(chunks, ignore_index=True)
+
+def test_lines_with_extra_fields_are_skipped(tmpdir):
+    df = read(accelerometer, tmpdir, [
+        'timestamp,UTC time,accuracy,x,y,z',
+        '1552039200000,2019-03-08T10:00:00.000,unknown,0.1,0.2,0.3',
+        '1552039200100,2019-03-08T10:00:00.100,unknown,0.1,0.2,0.3,0.4',
+        '',
+        '1552039200200,2019-03-08T10:00:00.200,unknown,0.1,0.2,0.3',
+        '1552039200300,2019-03-08T10:00:00.300,unknown,0.1,0.2,0.3,',
+        '1552039200400,2019-03-08T10:00:00.400,unknown,0.1',
+    ])
+    assert df.columns.tolist() == ['timestamp', 'UTC time']
+    assert df['timestamp'].tolist() == [1552039200000, 1552039200200, 1552039200400]
+
+def test_quoted_fields_are_read_whole(tmpdir):
+    df = read(texts, tmpdir, [
+        'timestamp,UTC time,hashed phone number,sent vs received,message length',
+        '1552039200000,2019-03-08T10:00:00.000,"01,23",received SMS,12',
+        '1552039201000,2019-03-08T10:00:01.000,0456,sent SMS,7,extra',
+    ])
+    assert df['hashed phone number'].tolist() == ['01,23']
+    assert df['message length'].tolist() == [12]
+
+def test_declared_columns_are_typed(tmpdir):
+    df = read(texts, tmpdir, [
+        'timestamp,UTC time,hashed phone number,sent vs received,message length,time sent',
+        '1552039200000,2019-03-08T10:00:00.000,0123,received SMS,12,',
+        '1552039201000,2019-03-08T10:00:01.000,0456,sent SMS,,',
+    ])
+    assert 'time sent' not in df.columns
+    assert df['hashed phone number'].tolist() == ['0123', '0456']
+    assert df['message length'].isnull().tolist() == [False, True]
+
+# Names of the files of every hour from a day before to a day after the
+# given days, as wall times in the input time zone, and the UTC hour each
+# one starts
+def file_hours(first, last, input_tz):
+    hours = pd.date_range(pd.Timestamp(first) - pd.Timedelta(days=1),
+        pd.Timestamp(last) + pd.Timedelta(days=2), freq='H', tz='UTC')
+    return [(h.tz_convert(input_tz).strftime('%Y-%m-%d %H_%M_%S.csv'), h) for h in hours]
+
+# Days 10 and 3 from these dates start on a DST change in America/New_York
+@pytest.mark.parametrize('date_from,output_tz,input_tz', [
+    ('2019-03-01', 'America/New_York', 'UTC'),
+    ('2019-03-01', 'America/New_York', 'America/New_York'),
+    ('2019-11-01', 'America/New_York', 'America/New_York'),
+    ('2019-11-01', 'UTC', 'America/New_York'),
+    ('2019-11-01', 'Asia/Kolkata', 'America/New_York'),
+])
+def test_day_window_keeps_every_file_of_its_days(date_from, output_tz, input_tz):
+    day = 10 if date_from == '2019-03-01' else 3
+    date = pd.Timestamp(date_from) + pd.Timedelta(days=day - 1)
+    window = beiwe.DayWindow(pd.Timestamp(date_from), day, day, output_tz, input_tz)
+    start = date.tz_localize(output_tz)
+    end = (date + pd.Timedelta(days=1)).tz_localize(output_tz)
+
+    kept = {}
+    for file_name, hour in file_hours(date, date, input_tz):
+        kept[hour] = window.keep(file_name)
+
+    # A file holds the hour after its name
+    for hour, keep in kept.items():
+        if hour + beiwe.FILE_HOURS > start and hour < end:
+            assert keep, hour
+        if hour + beiwe.FILE_HOURS + beiwe.WINDOW_MARGIN * 2 <= start or \
+                hour >= end + beiwe.WINDOW_MARGIN * 2:
+            assert not keep, hour
+    assert window.before == sum(1 for h, k in kept.items() if not k and h < start)
+    assert window.after == sum(1 for h, k in kept.items() if not k and h >= end)
+
+def test_day_window_without_bounds_keeps_every_file():
+    window = beiwe.DayWindow(pd.Timestamp('2019-03-01'), None, None, 'UTC', 'UTC')
+    assert all(window.keep(name) for name, hour in file_hours('2019-03-01', '2019-03-05', 'UTC'))
+    assert window.before == window.after == 0
@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from logbook import tools
+from logbook.phone import accelerometer
+from logbook.tools import beiwe
+from logbook.tools import cache
+from logbook.tools import inventory
+
+LINES = [
+    'timestamp,UTC time,accuracy,x,y,z',
+    '1552039200000,2019-03-08T10:00:00.000,unknown,0.1,0.2,0.3',
+    '1552039201000,2019-03-08T10:00:01.000,unknown,0.1,0.2,0.3',
+]
+
+@pytest.fixture
+def cache_dir(tmpdir):
+    cache.set_cache(str(tmpdir.join('cache')))
+    yield tmpdir.join('cache')
+    cache.set_cache()
+    inventory.set_inventory(None)
+
+def raw_file(tmpdir):
+    path = tmpdir.join('2019-03-08 10_00_00.csv')
+    path.write('\n'.join(LINES) + '\n')
+    return str(path)
+
+def parse(file_path):
+    return list(beiwe.parse_chunks(accelerometer, file_path, '.csv', 'UTC', 'UTC'))
+
+def entries(cache_dir):
+    return [p for p in cache_dir.visit() if p.check(file=1)] if cache_dir.check() else []
+
+def test_complete_read_is_stored_and_loaded(tmpdir, cache_dir, monkeypatch):
+    file_path = raw_file(tmpdir)
+    parsed = parse(file_path)
+    assert len(entries(cache_dir)) == 1
+
+    monkeypatch.setattr(beiwe, 'read_csv', None)
+    cached = parse(file_path)
+    assert cached[0]['data_points'].tolist() == parsed[0]['data_points'].tolist()
+
+def test_partial_read_is_not_stored(tmpdir, cache_dir, monkeypatch):
+    file_path = raw_file(tmpdir)
+    read_csv = beiwe.read_csv
+    def failing_read_csv(mod, path, extension):
+        for chunk in read_csv(mod, path, extension):
+            yield chunk
+        raise IOError('truncated file')
+    monkeypatch.setattr(beiwe, 'read_csv', failing_read_csv)
+
+    assert len(parse(file_path)) == 1
+    assert entries(cache_dir) == []
+
+def test_key_uses_the_inventory(tmpdir, cache_dir):
+    file_path = raw_file(tmpdir)
+    inv = inventory.build_inventory([str(tmpdir)])
+    inventory.set_inventory(inv)
+    entry = tools.file_stat(file_path)
+    assert entry is inv.entry(file_path)
+
+    key = cache.key(file_path, entry.size, entry.mtime, 'accelerometer', 'UTC')
+    assert key != cache.key(file_path, entry.size + 1, entry.mtime, 'accelerometer', 'UTC')
+    assert key != cache.key(file_path, entry.size, entry.mtime + 1, 'accelerometer', 'UTC')
+    assert tools.file_stat(str(tmpdir.join('missing.csv'))) is None
+
+def test_evict_removes_stale_temporary_files(cache_dir):
+    stale = cache_dir.ensure('ab', 'ab01.pkl.123.tmp')
+    fresh = cache_dir.ensure('ab', 'ab02.pkl.456.tmp')
+    entry = cache_dir.ensure('ab', 'ab03.pkl')
+    old = time.time() - cache.TEMP_AGE - 60
+    os.utime(str(stale), (old, old))
+    os.utime(str(entry), (old, old))
+
+    cache.evict()
+
+    assert not stale.check()
+    assert fresh.check() and entry.check()
@@ -0,0 +1,31 @@
+import json
+import multiprocessing as mp
+
+from logbook.tools import manifest
+
+SAVES = 20
+
+# Record a stream many times, saving the shared manifest after each one
+def save_stream(args):
+    path, key = args
+    m = manifest.Manifest(path, {'date_from': '2019-03-08'})
+    for i in range(SAVES):
+        m.pending[key] = {'params': m.params, 'files': {key: [i, i]}}
+        m.update(key)
+        m.save()
+
+def test_concurrent_saves_keep_every_stream(tmpdir):
+    path = str(tmpdir.join('.logbook', 'STUDY-S01-phone_manifest.json'))
+    keys = ['stream{N}'.format(N=n) for n in range(8)]
+
+    pool = mp.Pool(processes=len(keys))
+    try:
+        pool.map(save_stream, [(path, key) for key in keys], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(path) as f:
+        entries = json.load(f)['entries']
+    assert sorted(entries) == keys
+    assert all(entries[key]['files'][key] == [SAVES - 1] * 2 for key in keys)
@@ -0,0 +1,102 @@
+import os
+
+import pandas as pd
+
+import logbook
+from logbook import phone
+from logbook.tools import beiwe
+from logbook.tools import manifest
+from logbook.tools import writers
+
+DATE_FROM = '2019-03-01'
+HEADER = 'timestamp,UTC time,accuracy,x,y,z'
+
+# Accelerometer files of the given days, with a few samples each
+def make_stream(read_dir, days):
+    stream_dir = read_dir.join('beiwe01', 'accelerometer')
+    stream_dir.ensure(dir=True)
+    for day in days:
+        start = pd.Timestamp(DATE_FROM) + pd.Timedelta(days=day - 1, hours=12)
+        lines = [HEADER]
+        for ms in [0, 100, 1100]:
+            t = start + pd.Timedelta(milliseconds=ms)
+            lines.append('{T},{U},unknown,0.1,0.2,0.3'.format(T=t.value // 10 ** 6,
+                U=t.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]))
+        stream_dir.join(start.strftime('%Y-%m-%d %H_%M_%S.csv')).write('\n'.join(lines) + '\n')
+
+# Export the stream for days 4 to 5 and return the content of the output
+def export(tmpdir, output_name, manifest=None):
+    output_dir = tmpdir.join(output_name)
+    output_dir.ensure(dir=True)
+    phone.process('phone', 'STUDY', 'S01', str(tmpdir.join('raw')),
+        logbook.get_date_from(DATE_FROM, 'UTC'), 'UTC', 'UTC', 4, 5,
+        str(output_dir), ['accelerometer'], manifest)
+    outputs = output_dir.listdir()
+    assert len(outputs) == 1
+    return outputs[0].read()
+
+# Export again with every file read, as before files were skipped
+def export_reading_every_file(tmpdir, monkeypatch):
+    monkeypatch.setattr(beiwe.DayWindow, 'keep', lambda self, file_name: True)
+    return export(tmpdir, 'every')
+
+def test_window_without_data_lists_its_days(tmpdir, monkeypatch):
+    make_stream(tmpdir.join('raw'), [1, 9])
+    read = []
+    read_csv = beiwe.read_csv
+    monkeypatch.setattr(beiwe, 'read_csv', lambda mod, path, extension:
+        read.append(path) or read_csv(mod, path, extension))
+
+    output = export(tmpdir, 'window')
+
+    assert read == []
+    df = pd.read_csv(str(tmpdir.join('window').listdir()[0]))
+    assert df['day'].tolist() == [4, 5]
+    assert 'data_points' in df.columns and df['data_points'].isnull().all()
+    assert output == export_reading_every_file(tmpdir, monkeypatch)
+
+def test_window_after_the_data_has_no_rows(tmpdir, monkeypatch):
+    make_stream(tmpdir.join('raw'), [1, 2])
+
+    output = export(tmpdir, 'window')
+
+    assert output.splitlines()[0].startswith('reftime,day,timeofday')
+    assert len(output.splitlines()) == 1
+    assert output == export_reading_every_file(tmpdir, monkeypatch)
+
+def test_skipped_days_after_the_window_are_padded(tmpdir, monkeypatch):
+    make_stream(tmpdir.join('raw'), [2, 4, 9])
+
+    output = export(tmpdir, 'window')
+
+    df = pd.read_csv(str(tmpdir.join('window').listdir()[0]))
+    assert df['day'].tolist() == [4, 5]
+    assert df['data_points'].tolist()[0] == 3
+    assert output == export_reading_every_file(tmpdir, monkeypatch)
+
+def test_empty_daily_frame_has_the_fixed_columns_of_a_stream():
+    date_from = pd.Timestamp(DATE_FROM)
+    columns = dict((name, phone.empty_daily_df(phone.import_mod(name), date_from).columns)
+        for name in ['accelerometer', 'audio_recordings', 'texts'])
+    assert 'data_points' in columns['accelerometer']
+    assert 'recordings' in columns['audio_recordings']
+    assert set(phone.SECONDS_KEYS) <= set(columns['texts'])
+
+def test_failed_export_is_not_recorded_in_the_manifest(tmpdir, monkeypatch):
+    make_stream(tmpdir.join('raw'), [4])
+    path = str(tmpdir.join('manifest.json'))
+    stream_dirs = [str(tmpdir.join('raw', 'beiwe01', 'accelerometer'))]
+    def failing_writer(data, file_path, columns):
+        raise IOError('disk full')
+
+    with monkeypatch.context() as m:
+        m.setitem(writers.WRITERS, writers.CSV, failing_writer)
+        failed = logbook.tools.FAILED_EXPORTS
+        phone.process('phone', 'STUDY', 'S01', str(tmpdir.join('raw')),
+            logbook.get_date_from(DATE_FROM, 'UTC'), 'UTC', 'UTC', 4, 5,
+            str(tmpdir), ['accelerometer'], manifest.Manifest(path, {}))
+        assert logbook.tools.FAILED_EXPORTS == failed + 1
+    assert not manifest.Manifest(path, {}).unchanged('accelerometer', stream_dirs)
+
+    export(tmpdir, 'output', manifest.Manifest(path, {}))
+    assert manifest.Manifest(path, {}).unchanged('accelerometer', stream_dirs)
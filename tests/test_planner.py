@@ -0,0 +1,44 @@
+import pytest
+
+from logbook.tools import instrument
+from logbook.tools import planner
+
+# Stages of a run over 4 accelerometer files of 1 MB and 2 audio recordings,
+# as written by --report
+def stage(stream, name, seconds, files=0, size=0):
+    return {'study': 'STUDY', 'subject': 'S01', 'data_type': 'phone',
+        'stream': stream, 'stage': name, 'calls': 1, 'seconds': seconds,
+        'rows': 0, 'bytes': size, 'files': files}
+
+STAGES = [
+    stage('accelerometer', 'read_csv', 2.0, files=4, size=4 * 2 ** 20),
+    stage('accelerometer', 'parse', 1.0),
+    stage('accelerometer', 'accumulate', 1.0),
+    # Nested in accumulate
+    stage('accelerometer', 'bin_seconds', 0.2),
+    stage('accelerometer', 'parse_date_to', 0.3),
+    stage('accelerometer', 'partial_seconds', 0.5),
+    # Once per stream
+    stage('accelerometer', 'process_seconds', 0.4),
+    stage('accelerometer', 'process_daily', 0.1),
+    stage('accelerometer', 'export', 0.2, files=1),
+    stage('audio_recordings', 'parse', 0.1, files=2),
+    stage('audio_recordings', 'accumulate', 0.1),
+    stage('audio_recordings', 'export', 0.3, files=1),
+]
+
+@pytest.mark.parametrize('extension', ['.json', '.csv'])
+def test_throughput_counts_each_file_once(tmpdir, extension):
+    path = str(tmpdir.join('report' + extension))
+    instrument.write_report(path, [{'job': 'job0', 'stages': STAGES}])
+
+    throughput = planner.load_throughput(path)
+
+    accelerometer = throughput[('phone', 'accelerometer')]
+    assert accelerometer['bytes_per_second'] == pytest.approx(2 ** 20)
+    assert accelerometer['seconds_per_file'] == pytest.approx(1.0)
+    assert throughput[('phone', 'audio_recordings')] == {'seconds_per_file': pytest.approx(0.1)}
+    assert throughput['all']['seconds_per_file'] == pytest.approx(4.2 / 6)
+
+def test_missing_report_has_no_throughput(tmpdir):
+    assert planner.load_throughput(str(tmpdir.join('missing.json'))) == {}
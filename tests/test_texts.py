@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from logbook import phone
+from logbook.phone import texts
+
+def texts_df(rows):
+    return pd.DataFrame(rows, columns=['day', 'weekday', 'timeofday', 'UTC_offset',
+        'sent vs received', 'hashed phone number', 'message length'])
+
+# Seconds of the texts of several batches, merged as the files of a stream are
+def seconds_of(batches):
+    partials = phone.merge_parts([texts.partial_seconds(b) for b in batches])
+    return texts.process_seconds(partials).set_index('timeofday')
+
+def test_blank_length_stays_in_its_second():
+    df = texts_df([
+        [1, 5, 10, -500, 'received SMS', 'a', 100.0],
+        [1, 5, 20, -500, 'received SMS', 'b', np.nan],
+        [1, 5, 30, -500, 'received SMS', 'a', 214.0],
+        [1, 5, 30, -500, 'received SMS', 'c', 200.0],
+        [1, 5, 30, -500, 'sent SMS', 'c', 50.0],
+    ])
+    seconds = seconds_of([df.iloc[:2], df.iloc[2:]])
+
+    received = ['received_total_message_length_' + s for s in ['min', 'max', 'sum', 'mean']]
+    assert seconds.loc[10, received].tolist() == [100.0, 100.0, 100.0, 100.0]
+    assert seconds.loc[20, received].tolist() == [0.0, 0.0, 0.0, 0.0]
+    assert seconds.loc[30, received].tolist() == [200.0, 214.0, 414.0, 207.0]
+    assert seconds.loc[30, 'sent_total_message_length_sum'] == 50.0
+    assert seconds.loc[10, 'sent_total_message_length_sum'] == 0.0
+    assert seconds.loc[20, 'received_total_counts'] == '1'
+
+def test_matches_a_single_pass():
+    rng = np.random.RandomState(1)
+    n = 500
+    lengths = rng.randint(1, 300, n).astype(float)
+    lengths[rng.rand(n) < 0.2] = np.nan
+    df = texts_df({
+        'day': rng.randint(1, 3, n),
+        'weekday': 1,
+        'timeofday': rng.randint(0, 40, n),
+        'UTC_offset': -500,
+        'sent vs received': rng.choice(['sent SMS', 'received SMS', 'received MMS'], n),
+        'hashed phone number': rng.choice(list('abcdef'), n),
+        'message length': lengths,
+    })
+    seconds = seconds_of(np.array_split(df, 7)).reset_index()
+
+    # Statistics of each kind of message, added up for each direction
+    lengths = df.dropna(subset=['message length'])
+    kinds = lengths.groupby(['day', 'timeofday', 'sent vs received'])['message length']
+    kinds = kinds.agg(['sum', 'max']).reset_index()
+    sent = kinds['sent vs received'].str.startswith('sent')
+    expected = kinds.groupby(['day', 'timeofday', sent])[['sum', 'max']].sum()
+    for (day, second, sent), row in expected.iterrows():
+        found = seconds[(seconds['day'] == day) & (seconds['timeofday'] == second)]
+        prefix = 'sent' if sent else 'received'
+        assert found[prefix + '_total_message_length_sum'].iloc[0] == row['sum']
+        assert found[prefix + '_total_message_length_max'].iloc[0] == row['max']
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from logbook import tools
+from logbook.tools import writers
+
+DATE_FROM = pd.Timestamp('2019-03-01')
+
+# Seconds around 01:00-04:00 UTC, local time, on the days of the DST changes
+# of each zone, and a missing time
+def seconds(tz, dates):
+    index = pd.DatetimeIndex([])
+    for date in dates:
+        start = pd.Timestamp(date, tz='UTC') - pd.Timedelta(hours=12)
+        index = index.append(pd.date_range(start, periods=36 * 60, freq='61S'))
+    index = index.tz_convert(tz)
+    return index.insert(len(index), pd.NaT)
+
+ZONES = [
+    ('America/New_York', ['2019-03-10 07:00', '2019-11-03 06:00']),
+    ('Australia/Adelaide', ['2019-04-06 16:30', '2019-10-05 16:30']),
+    ('Asia/Kolkata', ['2019-03-10 00:00']),
+    ('UTC', ['2019-03-10 00:00']),
+]
+
+# Day, weekday, time and offset of each row, formatted one timestamp at a time
+def baseline(index):
+    return pd.DataFrame({
+        'day': [tools.process_date(t, DATE_FROM) if t is not pd.NaT else np.nan for t in index],
+        'weekday': [tools.process_weekday(t) if t is not pd.NaT else np.nan for t in index],
+        'timeofday': [tools.process_time(t) if t is not pd.NaT else np.nan for t in index],
+        'UTC_offset': [tools.process_utcoffset(t) for t in index],
+    }, index=index)[['day', 'weekday', 'timeofday', 'UTC_offset']]
+
+def frame(index):
+    return pd.DataFrame({'counts': 1}, index=index)
+
+@pytest.mark.parametrize('tz,dates', ZONES)
+def test_date_codes_match_the_timestamp_formatting(tz, dates):
+    index = seconds(tz, dates)
+    expected = baseline(index).dropna()
+
+    codes = tools.parse_date_codes(frame(index), DATE_FROM)
+    formatted = tools.format_seconds(codes.copy())
+    vectorized = tools.parse_date_to(frame(index), DATE_FROM)
+
+    for df in [formatted, vectorized]:
+        assert len(df) == len(expected)
+        for column in ['day', 'weekday', 'timeofday', 'UTC_offset']:
+            assert df[column].tolist() == expected[column].tolist(), column
+    assert len(set(expected['UTC_offset'])) == (2 if len(dates) > 1 else 1)
+
+def test_offsets_are_signed_hours_and_minutes():
+    index = pd.DatetimeIndex(['2019-03-10 12:00', '2019-03-10 13:00'], tz='UTC')
+    for tz, codes, labels in [
+            ('America/New_York', [-400, -400], ['-0400', '-0400']),
+            ('America/St_Johns', [-230, -230], ['-0230', '-0230']),
+            ('Asia/Kolkata', [530, 530], ['+0530', '+0530']),
+            ('UTC', [0, 0], ['+0000', '+0000'])]:
+        df = tools.parse_date_codes(frame(index.tz_convert(tz)), DATE_FROM)
+        assert df['UTC_offset'].tolist() == codes
+        assert tools.format_seconds(df.copy(), utc_offset=False)['UTC_offset'].tolist() == codes
+        assert tools.format_seconds(df)['UTC_offset'].tolist() == labels
+
+def test_missing_times_make_float_days():
+    index = pd.DatetimeIndex(['2019-03-10 12:00', pd.NaT], tz='America/New_York')
+    df = tools.parse_date_codes(frame(index), DATE_FROM)
+    assert df['day'].dtype.kind == 'f' and df['day'].tolist() == [10.0]
+
+# Days padded as they were, with DataFrame.append and blanks filled with ''
+def baseline_add_days(data):
+    days = data['day'].unique()
+    missing_days = [x for x in range(1, max(days) + 1) if x not in days]
+    data = data.append(pd.DataFrame(missing_days, columns=['day']), ignore_index=True,
+        sort=True)
+    return tools.sort_daily(data.fillna(''))
+
+def test_added_days_are_written_as_before(tmpdir):
+    data = pd.DataFrame({
+        'day': [0, 2, 5, 5, 9],
+        'weekday': [4, 6, 2, 2, 6],
+        'UTC_offset': ['-0500', '-0500', '-0500', '-0400', '-0400'],
+        'counts': [3, 1, 4, 1, 5],
+        'mean': [0.25, np.nan, 1.5, 2.0, np.nan],
+        'kind': ['a', None, 'b', 'c', 'd'],
+    })
+    columns = ['day', 'weekday', 'UTC_offset', 'counts', 'mean', 'kind']
+    written = []
+    for df in [tools.add_days(data.copy()), baseline_add_days(data.copy())]:
+        path = str(tmpdir.join('out{N}.csv'.format(N=len(written))))
+        writers.write(df, path, columns)
+        written.append(open(path).read())
+
+    assert written[0] == written[1]
+    padded = tools.add_days(data.copy())
+    assert padded['day'].tolist() == [0, 1, 2, 3, 4, 5, 5, 6, 7, 8, 9]
+    assert padded['counts'].dtype.kind == 'f'
@@ -0,0 +1,52 @@
+import os
+import signal
+
+import logbook
+from logbook.tools import workqueue
+
+QUEUE = {'lease': 2, 'poll': 0.2}
+
+def jobs(names):
+    return [logbook.Job('STUDY', 'S01', 'phone', '/read', '/output', '2019-03-08',
+        name=name) for name in names]
+
+def test_killed_worker_process_is_replaced(tmpdir, monkeypatch):
+    queue_dir = str(tmpdir.join('queue'))
+    killed = str(tmpdir.join('killed'))
+    names = ['job{N}'.format(N=n) for n in range(4)]
+    workqueue.WorkQueue(queue_dir, **QUEUE).enqueue(jobs(names))
+
+    # The process running job1 is killed the first time, as by the OOM killer
+    def run_job(job):
+        if job.name == 'job1' and not os.path.exists(killed):
+            open(killed, 'w').close()
+            os.kill(os.getpid(), signal.SIGKILL)
+        return {'job': job.name, 'status': 'ok', 'error': '', 'elapsed': 0.0,
+            'stages': []}
+    monkeypatch.setattr(logbook, 'run_job', run_job)
+
+    results = workqueue.run_worker(queue_dir, 2, **QUEUE)
+
+    assert sorted(r['job'] for r in results) == names
+    status = workqueue.WorkQueue(queue_dir, **QUEUE).status()
+    assert status[workqueue.DONE] == len(names)
+    assert status[workqueue.PENDING] == status[workqueue.CLAIMED] == 0
+
+def test_job_that_keeps_killing_its_worker_is_reported(tmpdir, monkeypatch):
+    queue_dir = str(tmpdir.join('queue'))
+    queue = dict(QUEUE, max_attempts=2)
+    names = ['job{N}'.format(N=n) for n in range(3)]
+    workqueue.WorkQueue(queue_dir, **queue).enqueue(jobs(names))
+
+    def run_job(job):
+        if job.name == 'job1':
+            os.kill(os.getpid(), signal.SIGKILL)
+        return {'job': job.name, 'status': 'ok', 'error': '', 'elapsed': 0.0,
+            'stages': []}
+    monkeypatch.setattr(logbook, 'run_job', run_job)
+
+    results = workqueue.run_worker(queue_dir, 2, **queue)
+
+    assert sorted(r['job'] for r in results) == names
+    failed = [r for r in results if r['status'] == 'failed']
+    assert [(r['job'], r['error']) for r in failed] == [('job1', 'lease expired')]
@@ -0,0 +1,107 @@
+import io
+import os
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from logbook.tools import writers
+
+COLUMNS = ['day', 'weekday', 'UTC_offset', 'subject', 'counts', 'mean', 'missing']
+
+@pytest.fixture
+def output_format():
+    yield
+    writers.set_format(writers.CSV)
+
+def daily_df():
+    return pd.DataFrame({
+        'day': [1, 2, 3],
+        'weekday': [5.0, 6.0, np.nan],
+        'UTC_offset': ['-0500', '-0500', np.nan],
+        'subject': ['0123', '0123', '0123'],
+        'counts': ['4', '10', np.nan],
+        'mean': [0.25, np.nan, 1.5],
+    })
+
+def write(tmpdir, output_format, data):
+    writers.set_format(output_format)
+    path = str(tmpdir.join('out' + writers.extension()))
+    writers.write(data, path, COLUMNS)
+    return path
+
+@pytest.mark.parametrize('name', ['parquet', 'feather'])
+def test_columnar_round_trip_keeps_types(tmpdir, output_format, name):
+    pytest.importorskip('pyarrow')
+    path = write(tmpdir, name, daily_df())
+    df = pd.read_parquet(path) if name == 'parquet' else pd.read_feather(path)
+
+    assert df.columns.tolist() == COLUMNS
+    assert df['day'].dtype == np.int64
+    assert df['weekday'].dtype == np.float64
+    assert df['counts'].tolist()[:2] == [4, 10] and np.isnan(df['counts'].iloc[2])
+    assert df['mean'].isnull().tolist() == [False, True, False]
+    assert df['UTC_offset'].tolist() == ['-0500', '-0500', None]
+    assert df['subject'].tolist() == ['0123'] * 3
+    assert df['missing'].isnull().all()
+
+@pytest.mark.parametrize('name', ['csv.gz', 'csv.zst'])
+def test_compressed_csv_holds_the_csv(tmpdir, output_format, name):
+    if name == 'csv.zst':
+        zstandard = pytest.importorskip('zstandard')
+    data = daily_df().assign(missing=np.nan)
+    expected = open(write(tmpdir, 'csv', data), 'rb').read()
+    path = write(tmpdir, name, data)
+
+    if name == 'csv.gz':
+        text = gzip.open(path, 'rb').read()
+    else:
+        reader = zstandard.ZstdDecompressor().stream_reader(io.open(path, 'rb'))
+        text = reader.read(10 ** 6)
+    assert text == expected
+    assert text.splitlines()[0] == b','.join(c.encode('utf-8') for c in COLUMNS)
+
+def test_missing_packages_are_an_error():
+    with pytest.raises(ValueError):
+        writers.check_format('xlsx')
+
+def test_unchanged_output_is_left_alone(tmpdir, output_format):
+    path = write(tmpdir, 'csv', daily_df())
+    past = 1500000000
+    os.utime(path, (past, past))
+
+    assert writers.write(daily_df(), path, COLUMNS) is False
+    assert os.path.getmtime(path) == past
+    assert tmpdir.listdir() == [tmpdir.join('out.csv')]
+
+def test_changed_output_is_replaced(tmpdir, output_format):
+    path = write(tmpdir, 'csv', daily_df())
+    before = open(path, 'rb').read()
+
+    assert writers.write(daily_df().assign(mean=2.0), path, COLUMNS) is True
+    after = open(path, 'rb').read()
+    assert after != before and b'2.0' in after
+    assert tmpdir.listdir() == [tmpdir.join('out.csv')]
+
+def test_failed_write_keeps_the_output(tmpdir, output_format, monkeypatch):
+    path = write(tmpdir, 'csv', daily_df())
+    before = open(path, 'rb').read()
+    def failing_writer(data, file_path, columns):
+        open(file_path, 'w').write('partial')
+        raise IOError('disk full')
+    monkeypatch.setitem(writers.WRITERS, writers.CSV, failing_writer)
+
+    with pytest.raises(IOError):
+        writers.write(daily_df().assign(mean=2.0), path, COLUMNS)
+    assert open(path, 'rb').read() == before
+    assert tmpdir.listdir() == [tmpdir.join('out.csv')]
+
+def test_same_content_compares_size_and_hash(tmpdir):
+    a, b, c = [tmpdir.join(n) for n in ['a', 'b', 'c']]
+    a.write('day\n1\n')
+    b.write('day\n1\n')
+    c.write('day\n2\n')
+    assert writers.same_content(str(a), str(b))
+    assert not writers.same_content(str(a), str(c))
+    assert not writers.same_content(str(a), str(tmpdir.join('missing')))